@@ -0,0 +1,58 @@
+"""
+Микробенчмарк разбора payload показаний датчиков.
+
+Сравнивает:
+- исходный способ сервисов: json.loads(payload.decode()) + dict.get;
+- payload.decode() с доступным декодером (orjson, если установлен, иначе json);
+- payload.decode() со стандартным json (без ускорителя).
+
+Запуск: python common/bench_payload.py [число сообщений]
+"""
+import json
+import sys
+import time
+
+import payload as codec
+
+MESSAGES = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+
+# Типичные сообщения сенсоров
+SAMPLES = [
+    codec.encode(value, 1_700_000_000_000 + i)
+    for i, value in enumerate((23, 17.5, 0, 39.25, 12))
+]
+
+
+def legacy(data):
+    # Разбор, как в сервисах до появления общего кодека
+    payload = json.loads(data.decode())
+    return payload.get("value"), payload.get("timestamp")
+
+
+def run(name, func):
+    samples = SAMPLES * (MESSAGES // len(SAMPLES))
+    started = time.perf_counter()
+    for data in samples:
+        func(data)
+    elapsed = time.perf_counter() - started
+    print(f"{name:<32} {len(samples) / elapsed:>12,.0f} msg/s")
+
+
+if __name__ == "__main__":
+    print(f"Messages: {MESSAGES}, payload example: {SAMPLES[0]!r}")
+    json_samples = list(SAMPLES)
+    run("legacy json.loads(str)", legacy)
+    run(f"codec.decode ({codec.DECODER})", codec.decode)
+
+    # Двоичный формат: тот же набор показаний
+    binary = [codec.encode_binary(23.0, 1_700_000_000_000 + i) for i in range(len(SAMPLES))]
+    print(f"{'payload size json / binary':<32} {len(SAMPLES[0]):>8} / {len(binary[0])} bytes")
+    SAMPLES[:] = binary
+    run("codec.decode (binary)", lambda data: codec.decode(data, codec.CONTENT_TYPE_BINARY))
+
+    SAMPLES[:] = json_samples
+    if codec.orjson is not None:
+        # Тот же codec.decode без ускорителя
+        codec._loads = json.loads
+        codec._decode_errors = (ValueError, UnicodeDecodeError)
+        run("codec.decode (json)", codec.decode)
@@ -0,0 +1,215 @@
+import json
+import math
+import struct
+
+# Ускоритель разбора JSON (опционально): orjson разбирает bytes напрямую и заметно быстрее json.
+# Если пакет не установлен, используется стандартный json (он тоже принимает bytes без decode()).
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+if orjson is not None:
+    _loads = orjson.loads
+    _dumps = orjson.dumps
+    _decode_errors = (orjson.JSONDecodeError, UnicodeDecodeError)
+else:
+    _loads = json.loads
+
+    def _dumps(obj):
+        return json.dumps(obj, separators=(",", ":")).encode()
+
+    _decode_errors = (ValueError, UnicodeDecodeError)
+
+# Имя используемого JSON-декодера (для логов и бенчмарка)
+DECODER = "orjson" if orjson is not None else "json"
+
+# -----------------------------------------
+# Форматы payload (MQTT 5 content_type)
+# -----------------------------------------
+CONTENT_TYPE_JSON = "application/json"
+CONTENT_TYPE_BINARY = "application/vnd.sensor-reading.v1"
+
+# Двоичный формат фиксированной длины (16 байт, little-endian):
+# значение float64 + timestamp int64 (мс)
+BINARY_READING = struct.Struct("<dq")
+
+# Двоичная сводка окна (36 байт): среднее float64 + timestamp int64 (мс)
+# + min float64 + max float64 + число замеров uint32.
+# Тот же content_type, форматы различаются длиной payload.
+BINARY_SUMMARY = struct.Struct("<dqddI")
+
+
+class PayloadError(ValueError):
+    """
+    Payload не соответствует схеме показания датчика.
+    """
+
+
+class Reading:
+    """
+    Показание датчика: значение и метка времени в миллисекундах
+    (None, если в сообщении её нет).
+
+    Для сводки окна, агрегированной на сенсоре, value — среднее,
+    а min, max и count — экстремумы и число замеров (иначе None).
+    """
+
+    __slots__ = ("value", "timestamp", "min", "max", "count")
+
+    def __init__(self, value, timestamp=None, min=None, max=None, count=None):
+        self.value = value
+        self.timestamp = timestamp
+        self.min = min
+        self.max = max
+        self.count = count
+
+    def __repr__(self):
+        if self.count is None:
+            return f"Reading(value={self.value!r}, timestamp={self.timestamp!r})"
+        return (
+            f"Reading(value={self.value!r}, timestamp={self.timestamp!r}, "
+            f"min={self.min!r}, max={self.max!r}, count={self.count!r})"
+        )
+
+
+def _invalid(obj, field):
+    # Точная причина ошибки вычисляется только на медленном пути
+    if isinstance(obj, bool) or not isinstance(obj, (int, float)):
+        return PayloadError(f"field '{field}' must be a number, got {obj!r}")
+    return PayloadError(f"field '{field}' must be finite, got {obj!r}")
+
+
+def content_type_of(properties):
+    """
+    Возвращает content_type из свойств MQTT 5 сообщения
+    (None для MQTT 3.1.1 или если свойство не задано).
+    """
+    return getattr(properties, "ContentType", None)
+
+
+def decode_binary(payload):
+    """
+    Разбирает двоичный payload (BINARY_READING или BINARY_SUMMARY) в Reading.
+    """
+    if len(payload) == BINARY_READING.size:
+        value, timestamp = BINARY_READING.unpack(payload)
+        if not math.isfinite(value):
+            raise _invalid(value, "value")
+        return Reading(value, timestamp)
+
+    if len(payload) == BINARY_SUMMARY.size:
+        value, timestamp, minimum, maximum, count = BINARY_SUMMARY.unpack(payload)
+        for field, number in (("value", value), ("min", minimum), ("max", maximum)):
+            if not math.isfinite(number):
+                raise _invalid(number, field)
+        return _summary(value, timestamp, minimum, maximum, count)
+
+    raise PayloadError(
+        f"binary payload must be {BINARY_READING.size} or {BINARY_SUMMARY.size} bytes, got {len(payload)}"
+    )
+
+
+def _int_to_float(number, field):
+    # Декодер json из stdlib разбирает целые любой длины, а float() для них вызывает OverflowError
+    try:
+        return float(number)
+    except OverflowError:
+        raise PayloadError(f"field '{field}' is out of range") from None
+
+
+def _number(data, field):
+    # Обязательное конечное число из JSON-объекта сводки
+    number = data.get(field)
+    if type(number) is int:
+        return _int_to_float(number, field)
+    if type(number) is not float or not math.isfinite(number):
+        raise _invalid(number, field)
+    return number
+
+
+def _summary(value, timestamp, minimum, maximum, count):
+    if type(count) is not int or count < 1:
+        raise PayloadError(f"field 'count' must be a positive integer, got {count!r}")
+    if not minimum <= value <= maximum:
+        raise PayloadError(f"summary must satisfy min <= value <= max, got {minimum!r}, {value!r}, {maximum!r}")
+    return Reading(value, timestamp, minimum, maximum, count)
+
+
+def decode(payload, content_type=None):
+    """
+    Разбирает payload MQTT-сообщения (bytes) в Reading.
+
+    Поддерживаемые форматы:
+    - JSON-объект {"value": <число>, "timestamp": <мс, целое>}; timestamp необязателен;
+    - сводка окна: тот же объект с полями "min", "max" и "count" (value — среднее);
+    - голое число (JSON), например b"23.5";
+    - двоичные форматы BINARY_READING и BINARY_SUMMARY, если content_type == CONTENT_TYPE_BINARY.
+
+    Без content_type (MQTT 3.1.1) payload считается JSON.
+    Некорректный payload вызывает PayloadError. Значение 0 — корректное.
+    """
+    if content_type == CONTENT_TYPE_BINARY:
+        return decode_binary(payload)
+
+    try:
+        data = _loads(payload)
+    except _decode_errors as e:
+        raise PayloadError(f"payload is not valid JSON: {e}") from None
+
+    # Проверки типов через type(): bool (подкласс int) значением показания не считается
+    if type(data) is dict:
+        value = data.get("value")
+        if value is None:
+            raise PayloadError("field 'value' is missing")
+        if type(value) is int:
+            value = _int_to_float(value, "value")
+        elif type(value) is not float or not math.isfinite(value):
+            raise _invalid(value, "value")
+
+        timestamp = data.get("timestamp")
+        if timestamp is not None and type(timestamp) is not int:
+            if type(timestamp) is not float or not math.isfinite(timestamp) or timestamp != int(timestamp):
+                raise PayloadError(f"field 'timestamp' must be integer milliseconds, got {timestamp!r}")
+            timestamp = int(timestamp)
+
+        # Сводка окна: все три поля обязательны вместе
+        if "count" in data:
+            return _summary(value, timestamp, _number(data, "min"), _number(data, "max"), data["count"])
+
+        return Reading(value, timestamp)
+
+    if type(data) is int:
+        return Reading(_int_to_float(data, "value"))
+    if type(data) is float and math.isfinite(data):
+        return Reading(data)
+    raise _invalid(data, "value")
+
+
+def encode(value, timestamp):
+    """
+    Кодирует показание в JSON-payload {"value": ..., "timestamp": ...} (bytes).
+    """
+    return _dumps({"value": value, "timestamp": timestamp})
+
+
+def encode_binary(value, timestamp):
+    """
+    Кодирует показание в двоичный payload BINARY_READING (16 байт).
+    """
+    return BINARY_READING.pack(value, timestamp)
+
+
+def encode_summary(value, timestamp, minimum, maximum, count):
+    """
+    Кодирует сводку окна в JSON-payload
+    {"value": <среднее>, "timestamp": ..., "min": ..., "max": ..., "count": ...} (bytes).
+    """
+    return _dumps({"value": value, "timestamp": timestamp, "min": minimum, "max": maximum, "count": count})
+
+
+def encode_summary_binary(value, timestamp, minimum, maximum, count):
+    """
+    Кодирует сводку окна в двоичный payload BINARY_SUMMARY (36 байт).
+    """
+    return BINARY_SUMMARY.pack(value, timestamp, minimum, maximum, count)
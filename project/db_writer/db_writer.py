@@ -1,10 +1,23 @@
-from datetime import datetime
-import json
+from datetime import datetime, timezone
+from paho.mqtt.client import CallbackAPIVersion
+from paho.mqtt.packettypes import PacketTypes
+from collections import OrderedDict
+from metrics import Registry, start_http_server
+from payload import PayloadError, content_type_of, decode
+from paho.mqtt.properties import Properties
+from spool import Spool
+import csv
+import io
 import logging
+import multiprocessing
 import os
 import paho.mqtt.client as mqtt
 import psycopg2
+import psycopg2.pool
+import queue
+import threading
 import time
+import zlib
 
 # -----------------------------------------
 # Настройка логирования
@@ -21,6 +34,26 @@ MQTT_HOST = os.getenv("MQTT_HOST", "rabbitmq1")
 MQTT_PORT = int(os.getenv("MQTT_PORT", "1883"))
 MQTT_TOPIC = os.getenv("MQTT_TOPIC", "temperature/#")
 
+# -----------------------------------------
+# Горизонтальное масштабирование (несколько процессов записи)
+# -----------------------------------------
+# Число процессов записи, запускаемых локальным супервизором (1 — без супервизора)
+WRITER_PROCESSES = int(os.getenv("WRITER_PROCESSES", "1"))
+
+# Для запуска в виде N контейнеров: общее число писателей и номер текущего (0..N-1)
+WRITER_COUNT = int(os.getenv("WRITER_COUNT", str(WRITER_PROCESSES)))
+WRITER_INDEX = int(os.getenv("WRITER_INDEX", "0"))
+
+# Распределение нагрузки между писателями:
+# affinity — каждый писатель подписан на весь топик и пишет только свои сенсоры
+#            (crc32(sensor) % WRITER_COUNT), порядок строк сенсора сохраняется в одном писателе;
+#            работает с любым брокером, в т.ч. с MQTT-плагином RabbitMQ (по умолчанию);
+# shared   — MQTT 5 shared subscription $share/<группа>/<топик>, брокер раздаёт сообщения по кругу
+#            (нужна поддержка shared subscriptions брокером)
+SHARD_MODES = ("affinity", "shared")
+SHARD_MODE = os.getenv("SHARD_MODE", "affinity")
+SHARE_GROUP = os.getenv("SHARE_GROUP", "db_writer")
+
 # -----------------------------------------
 # Параметры подключения к базе TimescaleDB
 # -----------------------------------------
@@ -30,123 +63,1259 @@ DB_NAME = os.getenv("DB_NAME", "metrics")
 DB_USER = os.getenv("DB_USER", "postgres")
 DB_PASS = os.getenv("DB_PASS", "postgres")
 
-# Глобальная переменная подключения
-conn = None
+# Начальная и максимальная пауза (в секундах) между попытками переподключения к БД
+DB_RETRY_DELAY = float(os.getenv("DB_RETRY_DELAY", "0.5"))
+DB_RETRY_MAX_DELAY = float(os.getenv("DB_RETRY_MAX_DELAY", "30"))
+
+# -----------------------------------------
+# Локальный спул на время недоступности БД
+# -----------------------------------------
+# Записывать ли пакеты в локальный спул, если БД недоступна
+SPOOL_ENABLED = os.getenv("SPOOL_ENABLED", "true").lower() == "true"
+
+# Каталог спула и максимальный размер одного сегмента (в байтах)
+SPOOL_DIR = os.getenv("SPOOL_DIR", "/var/lib/db_writer/spool")
+SPOOL_SEGMENT_BYTES = int(os.getenv("SPOOL_SEGMENT_BYTES", str(64 * 1024 * 1024)))
+
+# Сколько попыток записи пакета в БД делается перед переключением на спул
+DB_WRITE_ATTEMPTS = int(os.getenv("DB_WRITE_ATTEMPTS", "3"))
+
+# Воспроизведение спула: размер пакета, ограничение скорости (строк/с)
+# и интервал проверки доступности БД (в секундах)
+SPOOL_REPLAY_BATCH = int(os.getenv("SPOOL_REPLAY_BATCH", "5000"))
+SPOOL_REPLAY_RATE = int(os.getenv("SPOOL_REPLAY_RATE", "20000"))
+SPOOL_CHECK_INTERVAL = float(os.getenv("SPOOL_CHECK_INTERVAL", "5"))
+
+# -----------------------------------------
+# Дедупликация повторных доставок QoS 1
+# -----------------------------------------
+# Сколько последних записанных ключей (sensor, timestamp_ms) помнить
+DEDUP_CACHE_SIZE = int(os.getenv("DEDUP_CACHE_SIZE", "100000"))
+
+# Сколько секунд помнить записанный ключ
+DEDUP_WINDOW_SEC = float(os.getenv("DEDUP_WINDOW_SEC", "600"))
+
+# -----------------------------------------
+# Непрерывные агрегаты (rollups) TimescaleDB
+# -----------------------------------------
+# Создавать ли агрегаты и политики их обновления при старте
+ROLLUPS_ENABLED = os.getenv("ROLLUPS_ENABLED", "true").lower() == "true"
+
+# Иерархия агрегатов: (представление, размер корзины, источник,
+# start_offset, end_offset, schedule_interval политики обновления).
+# Минутный агрегат строится по сырым данным, часовой — по минутному,
+# суточный — по часовому.
+ROLLUPS = [
+    ("temperature_1m", "1 minute", "temperature", "1 hour", "1 minute", "1 minute"),
+    ("temperature_1h", "1 hour", "temperature_1m", "1 day", "1 hour", "30 minutes"),
+    ("temperature_1d", "1 day", "temperature_1h", "7 days", "1 day", "1 hour"),
+]
+
+# Политики обновляют только последние корзины (start_offset), поэтому строки старше
+# LATE_ROWS_AGE секунд (воспроизведённый спул, досылка накопленных сенсором показаний)
+# агрегаты сами не увидят. Порог меньше start_offset минутного агрегата (1 час) с запасом:
+# строка не должна выйти из окна политики до её ближайшего запуска.
+LATE_ROWS_AGE = float(os.getenv("LATE_ROWS_AGE", "1800"))
+
+# Интервал обновления агрегатов по диапазону опоздавших строк (в секундах)
+LATE_ROWS_REFRESH_INTERVAL = float(os.getenv("LATE_ROWS_REFRESH_INTERVAL", "60"))
+
+# -----------------------------------------
+# Сжатие и срок хранения сырых данных
+# -----------------------------------------
+# Нативное сжатие чанков hypertable (сегментация по sensor_id, сортировка по time)
+COMPRESSION_ENABLED = os.getenv("COMPRESSION_ENABLED", "true").lower() == "true"
+
+# Сжимать чанки старше указанного числа дней
+COMPRESS_AFTER_DAYS = int(os.getenv("COMPRESS_AFTER_DAYS", "7"))
+
+# Удалять сырые чанки старше указанного числа дней (0 — хранить вечно).
+# Агрегаты temperature_1m/1h/1d при этом сохраняются.
+RETENTION_DAYS = int(os.getenv("RETENTION_DAYS", "30"))
+
+# -----------------------------------------
+# Параметры пакетной записи
+# -----------------------------------------
+# Максимальное число строк в пакете: при достижении пакет сбрасывается в БД
+BATCH_MAX_ROWS = int(os.getenv("BATCH_MAX_ROWS", "5000"))
+
+# Максимальный возраст пакета (мс): по истечении пакет сбрасывается даже неполным
+BATCH_MAX_AGE_MS = int(os.getenv("BATCH_MAX_AGE_MS", "200"))
+
+# -----------------------------------------
+# Параметры очереди между MQTT и БД
+# -----------------------------------------
+# Ёмкость очереди принятых, но ещё не записанных сообщений.
+# Это же значение передаётся брокеру как MQTT 5 Receive Maximum.
+QUEUE_MAX_SIZE = int(os.getenv("QUEUE_MAX_SIZE", "20000"))
+
+# Количество потоков, записывающих пакеты в БД
+DB_WORKERS = int(os.getenv("DB_WORKERS", "2"))
+
+# Порт HTTP-эндпоинта /metrics в формате Prometheus (0 — отключить).
+# При нескольких процессах записи писатель N слушает METRICS_PORT + N.
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9100"))
+
+# Интервал вывода глубины очереди в лог (в секундах, 0 — не выводить)
+QUEUE_REPORT_INTERVAL = int(os.getenv("QUEUE_REPORT_INTERVAL", "30"))
+
+# Очередь строк, ожидающих записи: (запись, mid, qos, generation),
+# где запись — (time, sensor, value, min, max, count); в БД и спул передаются только записи.
+# min, max и count заданы только у сводки окна, агрегированной на сенсоре
+ingest_queue = queue.Queue(maxsize=QUEUE_MAX_SIZE)
+
+class DedupFilter:
+    """
+    Ограниченный по размеру и времени фильтр уже записанных ключей
+    (sensor, timestamp_ms) — для дешёвого отсева повторных доставок
+    QoS 1 (например, после failover брокера) до записи в БД.
+
+    Ключ добавляется только после записи пакета, поэтому сообщение,
+    чья первая копия ещё не записана, проходит фильтр; такие дубликаты
+    отсекает уникальный индекс (ON CONFLICT DO NOTHING).
+    """
+
+    def __init__(self, max_size, window_sec):
+        self.max_size = max_size
+        self.window_sec = window_sec
+        # ключ -> момент добавления (time.monotonic()), в порядке добавления
+        self.keys = OrderedDict()
+        self.lock = threading.Lock()
+
+    def seen(self, key):
+        """
+        Возвращает True, если ключ уже был записан в пределах окна.
+        """
+        with self.lock:
+            added = self.keys.get(key)
+            return added is not None and time.monotonic() - added < self.window_sec
+
+    def add_many(self, keys):
+        """
+        Запоминает записанные ключи, вытесняя самые старые
+        (по размеру и по окну времени).
+        """
+        now = time.monotonic()
+        with self.lock:
+            for key in keys:
+                self.keys[key] = now
+                self.keys.move_to_end(key)
+
+            while self.keys and len(self.keys) > self.max_size:
+                self.keys.popitem(last=False)
+            while self.keys and now - next(iter(self.keys.values())) >= self.window_sec:
+                self.keys.popitem(last=False)
+
+
+# Фильтр повторных доставок
+dedup = DedupFilter(DEDUP_CACHE_SIZE, DEDUP_WINDOW_SEC)
+
+# Кэш идентификаторов сенсоров: имя сенсора (из топика) -> sensors.id
+sensor_ids = {}
+sensor_ids_lock = threading.Lock()
+
+# Пул соединений с TimescaleDB (создаётся в connect_db)
+db_pool = None
+
+# Столбцы сводки окна в temperature (NULL у одиночных показаний)
+SUMMARY_COLUMNS = [
+    ("min_value", "DOUBLE PRECISION"),
+    ("max_value", "DOUBLE PRECISION"),
+    ("sample_count", "INTEGER"),
+]
+
+# Признак того, что при старте агрегаты пересозданы (миграция таблицы прежней схемы
+# или смена определения агрегата) и их нужно заполнить по всей истории сырых данных
+rollups_refresh_needed = False
+
+# -----------------------------------------
+# Метрики (отдаются по /metrics)
+# -----------------------------------------
+metrics = Registry()
+messages_received = metrics.counter(
+    "db_writer_messages_received_total", "MQTT messages received")
+messages_parsed = metrics.counter(
+    "db_writer_messages_parsed_total", "Messages parsed and queued for writing")
+messages_rejected = metrics.counter(
+    "db_writer_messages_rejected_total", "Messages rejected as malformed")
+messages_duplicate = metrics.counter(
+    "db_writer_messages_duplicate_total", "Redeliveries dropped by the in-memory dedup filter")
+rows_written = metrics.counter(
+    "db_writer_rows_written_total", "Rows inserted into TimescaleDB")
+rows_spooled = metrics.counter(
+    "db_writer_rows_spooled_total", "Rows written to the local spool")
+db_reconnects = metrics.counter(
+    "db_writer_db_reconnects_total", "Database reconnects after a broken connection")
+batch_size = metrics.histogram(
+    "db_writer_batch_size", "Rows per written batch",
+    [1, 10, 50, 100, 500, 1000, 2500, 5000, 10000])
+flush_seconds = metrics.histogram(
+    "db_writer_flush_seconds", "Batch write latency",
+    [0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10])
+lag_seconds = metrics.histogram(
+    "db_writer_end_to_end_lag_seconds", "Commit time minus payload timestamp",
+    [0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300])
+metrics.gauge(
+    "db_writer_queue_depth", "Messages waiting in the ingest queue", lambda: ingest_queue.qsize())
+
+# Признак доступности БД: если сброшен, пакеты сразу пишутся в спул
+db_available = threading.Event()
+db_available.set()
+
+# Локальный спул (создаётся в main, если SPOOL_ENABLED)
+spool = None
+
+# Диапазон времени (начало, конец) записанных строк, вне окна политик обновления агрегатов
+late_range = None
+late_range_lock = threading.Lock()
+
+# Номер текущего писателя и общее число писателей (задаются в run_writer)
+writer_index = 0
+writer_count = 1
+
+# MQTT-клиент (нужен для ручного подтверждения сообщений после коммита)
+client = None
+
+# Номер MQTT-подключения: увеличивается при каждом подключении к брокеру.
+# Блокировка не даёт подтвердить сообщение старого подключения во время переподключения.
+connection_generation = 0
+connection_lock = threading.Lock()
 
 
 def connect_db():
     """
-    Устанавливает соединение с TimescaleDB.
-    Включает autocommit для упрощённой вставки данных.
+    Создаёт пул соединений с TimescaleDB: по одному соединению
+    на поток записи и одно для служебных запросов.
+    Пока база недоступна, повторяет попытки с экспоненциальной паузой.
+    Autocommit выключен: каждый пакет записывается одной транзакцией.
     """
-    global conn
-    conn = psycopg2.connect(
-        host=DB_HOST,
-        port=DB_PORT,
-        dbname=DB_NAME,
-        user=DB_USER,
-        password=DB_PASS
-    )
-    conn.autocommit = True
+    global db_pool
+    delay = DB_RETRY_DELAY
+
+    while True:
+        try:
+            db_pool = psycopg2.pool.ThreadedConnectionPool(
+                1,
+                DB_WORKERS + 1,
+                host=DB_HOST,
+                port=DB_PORT,
+                dbname=DB_NAME,
+                user=DB_USER,
+                password=DB_PASS
+            )
+            break
+        except psycopg2.OperationalError as e:
+            logging.error(f"Failed to connect to TimescaleDB: {e}; retrying in {delay:.1f} s")
+            time.sleep(delay)
+            delay = min(delay * 2, DB_RETRY_MAX_DELAY)
+
     logging.info("Connected to TimescaleDB")
 
 
-def create_table():
+def run_in_db(operation, *args, attempts=None):
     """
-    Создаёт таблицу temperature (если ещё не существует)
-    и преобразует её в hypertable — специальный формат TimescaleDB
-    для хранения временных рядов.
+    Выполняет operation(conn, *args) на соединении из пула.
+
+    Соединение берётся из пула на время одной операции (одного пакета).
+    Если соединение оборвалось (рестарт или failover TimescaleDB),
+    оно закрывается и удаляется из пула, а операция повторяется
+    на новом соединении с экспоненциальной паузой — до успеха
+    или до исчерпания attempts попыток (тогда пробрасывается
+    последняя ошибка соединения).
+    Прочие ошибки БД пробрасываются вызывающему коду.
     """
-    with conn.cursor() as cur:
+    delay = DB_RETRY_DELAY
+    attempt = 0
+
+    while True:
+        conn = None
+        attempt += 1
+        try:
+            conn = db_pool.getconn()
+            result = operation(conn, *args)
+        except (psycopg2.OperationalError, psycopg2.InterfaceError) as e:
+            # Соединение непригодно: закрываем его, чтобы пул открыл новое
+            if conn is not None:
+                db_pool.putconn(conn, close=True)
+            db_reconnects.inc()
+            if attempts is not None and attempt >= attempts:
+                raise
+            logging.warning(f"Database connection lost: {e}; reconnecting in {delay:.1f} s")
+            time.sleep(delay)
+            delay = min(delay * 2, DB_RETRY_MAX_DELAY)
+            continue
+        except Exception:
+            db_pool.putconn(conn, close=bool(conn.closed))
+            raise
+
+        db_pool.putconn(conn)
+        return result
+
+
+def create_table(conn):
+    """
+    Создаёт справочник сенсоров sensors и таблицу temperature
+    (если ещё не существуют) и преобразует temperature в hypertable —
+    специальный формат TimescaleDB для хранения временных рядов.
+
+    Имя сенсора хранится один раз в sensors, а в temperature —
+    только целочисленный sensor_id: строки и индексы меньше,
+    сжатие эффективнее. Для чтения с именами есть представление
+    temperature_readings.
+    """
+    with conn, conn.cursor() as cur:
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS sensors (
+                id SERIAL PRIMARY KEY,
+                name TEXT NOT NULL UNIQUE
+            );
+        """)
+
+        # Таблица прежней схемы (с текстовым столбцом sensor) переводится на sensor_id
+        migrate_legacy_sensor_column(cur)
+
+        # Внешний ключ на sensors не объявляется: он добавил бы проверку на каждую строку COPY
+        # Для сводки окна, агрегированной на сенсоре (REPORT_MODE=aggregate), value — среднее,
+        # а min_value/max_value/sample_count — экстремумы и число значений окна;
+        # у одиночного показания они NULL
         cur.execute("""
             CREATE TABLE IF NOT EXISTS temperature (
                 time TIMESTAMPTZ NOT NULL,
-                sensor TEXT NOT NULL,
-                value DOUBLE PRECISION NOT NULL
+                sensor_id INTEGER NOT NULL,
+                value DOUBLE PRECISION NOT NULL,
+                min_value DOUBLE PRECISION,
+                max_value DOUBLE PRECISION,
+                sample_count INTEGER
             );
         """)
 
+        # Таблица, созданная до появления столбцов сводки: добавляем их по одному
+        # (TimescaleDB не допускает нескольких изменений в одном ALTER на сжатой таблице)
+        for column, column_type in SUMMARY_COLUMNS:
+            cur.execute("""
+                SELECT 1 FROM information_schema.columns
+                WHERE table_schema = current_schema() AND table_name = 'temperature' AND column_name = %s;
+            """, (column,))
+            if cur.fetchone() is None:
+                cur.execute(f"ALTER TABLE temperature ADD COLUMN {column} {column_type};")
+                logging.info(f"Added column temperature.{column}")
+
         # Преобразование в hypertable
         cur.execute("""
             SELECT create_hypertable('temperature', 'time', if_not_exists => TRUE);
         """)
 
+        # Уникальный индекс: повторная доставка того же показания не создаёт дубликат
+        cur.execute("""
+            CREATE UNIQUE INDEX IF NOT EXISTS temperature_sensor_id_time_idx
+            ON temperature (sensor_id, time);
+        """)
+
+        # Новые столбцы добавляются в конец представления: CREATE OR REPLACE VIEW не меняет прежние
+        cur.execute("""
+            CREATE OR REPLACE VIEW temperature_readings AS
+            SELECT t.time, s.name AS sensor, t.value, t.min_value, t.max_value, t.sample_count
+            FROM temperature t
+            JOIN sensors s ON s.id = t.sensor_id;
+        """)
+
     logging.info("Table temperature is ready (hypertable created)")
 
 
-def on_connect(client, userdata, flags, rc):
+def migrate_legacy_sensor_column(cur):
+    """
+    Переводит таблицу temperature прежней схемы (имя сенсора в TEXT-столбце sensor)
+    на sensor_id в той же транзакции, что и создание схемы:
+    - имена сенсоров регистрируются в sensors;
+    - строки агрегатов прежней схемы копируются в обычные таблицы <агрегат>_legacy
+      (в них остаются корзины, сырые данные которых уже удалены политикой хранения),
+      после чего агрегаты удаляются — они ссылаются на столбец sensor;
+    - сжатые чанки распаковываются и сжатие отключается (нельзя удалить столбец сегментации);
+    - добавляется и заполняется sensor_id, столбец sensor удаляется,
+      повторные показания (sensor_id, time) удаляются.
+    Агрегаты и сжатие затем создаются заново (create_rollups, refresh_rollups,
+    apply_storage_policies). Для новой базы ничего не делает.
+    """
+    global rollups_refresh_needed
+
+    legacy_column = """
+        SELECT 1 FROM information_schema.columns
+        WHERE table_schema = current_schema() AND table_name = 'temperature' AND column_name = 'sensor';
+    """
+    cur.execute(legacy_column)
+    if cur.fetchone() is None:
+        return
+
+    # Несколько писателей могут стартовать одновременно: мигрирует первый,
+    # остальные ждут блокировку и видят уже новую схему
+    cur.execute("LOCK TABLE temperature IN ACCESS EXCLUSIVE MODE;")
+    cur.execute(legacy_column)
+    if cur.fetchone() is None:
+        return
+
+    logging.warning("Table temperature has the legacy TEXT column sensor, migrating to sensor_id")
+
+    cur.execute("""
+        INSERT INTO sensors (name)
+        SELECT DISTINCT sensor FROM temperature
+        ON CONFLICT (name) DO NOTHING;
+    """)
+
+    # Агрегаты прежней схемы: сохраняем их строки с sensor_id вместо имени
+    cur.execute("""
+        SELECT view_name FROM timescaledb_information.continuous_aggregates
+        WHERE hypertable_name = 'temperature' OR view_name = ANY(%s);
+    """, ([view for view, *_ in ROLLUPS],))
+    legacy_views = {name for (name,) in cur.fetchall()}
+    ordered_views = [view for view, *_ in ROLLUPS if view in legacy_views]
+    ordered_views += sorted(legacy_views - set(ordered_views))
+
+    for view in ordered_views:
+        cur.execute(f"""
+            INSERT INTO sensors (name)
+            SELECT DISTINCT sensor FROM {view}
+            ON CONFLICT (name) DO NOTHING;
+        """)
+        cur.execute(f"""
+            CREATE TABLE IF NOT EXISTS {view}_legacy AS
+            SELECT v.*, s.id AS sensor_id
+            FROM {view} v
+            JOIN sensors s ON s.name = v.sensor;
+        """)
+        cur.execute(f"ALTER TABLE {view}_legacy DROP COLUMN IF EXISTS sensor;")
+        logging.warning(f"Rows of legacy continuous aggregate {view} are kept in {view}_legacy")
+
+    # Агрегаты верхнего уровня зависят от нижних: удаляем сверху вниз
+    for view in reversed(ordered_views):
+        cur.execute(f"DROP MATERIALIZED VIEW IF EXISTS {view};")
+
+    cur.execute("""
+        SELECT compression_enabled
+        FROM timescaledb_information.hypertables
+        WHERE hypertable_name = 'temperature';
+    """)
+    row = cur.fetchone()
+    if row is not None and row[0]:
+        cur.execute("""
+            SELECT decompress_chunk(chunk, if_compressed => TRUE)
+            FROM show_chunks('temperature') AS chunk;
+        """)
+        cur.execute("SELECT remove_compression_policy('temperature', if_exists => TRUE);")
+        cur.execute("ALTER TABLE temperature SET (timescaledb.compress = false);")
+
+    cur.execute("ALTER TABLE temperature ADD COLUMN sensor_id INTEGER;")
+    cur.execute("""
+        UPDATE temperature t
+        SET sensor_id = s.id
+        FROM sensors s
+        WHERE s.name = t.sensor;
+    """)
+    cur.execute("ALTER TABLE temperature ALTER COLUMN sensor_id SET NOT NULL;")
+    # Индексы по sensor удаляются вместе со столбцом
+    cur.execute("ALTER TABLE temperature DROP COLUMN sensor;")
+
+    # Прежняя схема допускала повторные доставки одного показания;
+    # без удаления дублей не создастся уникальный индекс (sensor_id, time)
+    cur.execute("""
+        DELETE FROM temperature a
+        USING temperature b
+        WHERE a.sensor_id = b.sensor_id AND a.time = b.time AND a.ctid > b.ctid;
+    """)
+    if cur.rowcount:
+        logging.warning(f"Removed {cur.rowcount} duplicate readings from the legacy table")
+
+    rollups_refresh_needed = True
+    logging.warning("Table temperature migrated to sensor_id")
+
+
+def refresh_rollups(conn, start=None, end=None):
+    """
+    Обновляет агрегаты снизу вверх: политики обновления охватывают только последние корзины.
+    Без границ — по всем сохранившимся сырым данным (после пересоздания агрегатов),
+    иначе — по корзинам, в которые попадает диапазон [start, end].
+    """
+    # refresh_continuous_aggregate нельзя выполнять внутри транзакции
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cur:
+            for view, bucket, *_ in ROLLUPS:
+                if start is None:
+                    cur.execute("CALL refresh_continuous_aggregate(%s, NULL, NULL);", (view,))
+                    logging.info(f"Continuous aggregate {view} refreshed over the whole history")
+                    continue
+
+                # Обновляются только корзины, целиком попадающие в окно, поэтому границы выравниваются
+                cur.execute(
+                    "CALL refresh_continuous_aggregate(%s, time_bucket(%s::interval, %s::timestamptz), "
+                    "time_bucket(%s::interval, %s::timestamptz) + %s::interval);",
+                    (view, bucket, start, bucket, end, bucket)
+                )
+                logging.info(f"Continuous aggregate {view} refreshed from {start.isoformat()} to {end.isoformat()}")
+    finally:
+        conn.autocommit = False
+
+
+def note_late_rows(start, end):
+    """
+    Добавляет диапазон записанных строк к диапазону, по которому нужно обновить агрегаты.
+    """
+    global late_range
+
+    with late_range_lock:
+        if late_range is not None:
+            start, end = min(start, late_range[0]), max(end, late_range[1])
+        late_range = (start, end)
+
+
+def refresh_late_rows():
+    """
+    Обновляет агрегаты по накопленному диапазону опоздавших строк.
+    Если обновить не удалось, диапазон остаётся до следующей попытки.
+    """
+    global late_range
+
+    with late_range_lock:
+        pending, late_range = late_range, None
+    if pending is None:
+        return
+
+    try:
+        run_in_db(refresh_rollups, *pending, attempts=1)
+    except psycopg2.Error as e:
+        logging.warning(f"Refreshing rollups for late rows failed: {e}")
+        note_late_rows(*pending)
+
+
+def refresh_late_rows_periodically():
+    """
+    Фоновый поток: раз в LATE_ROWS_REFRESH_INTERVAL секунд обновляет агрегаты
+    по строкам, записанным вне окна политик обновления.
+    """
+    while True:
+        time.sleep(LATE_ROWS_REFRESH_INTERVAL)
+        refresh_late_rows()
+
+
+def drop_stale_rollups(conn):
+    """
+    Удаляет агрегаты, созданные до появления столбцов сводки окна: их min/max/count
+    считаются по средним окон. Непрерывный агрегат нельзя изменить, поэтому
+    строки агрегатов сохраняются в таблицах <агрегат>_legacy (в них остаются корзины,
+    сырые данные которых уже удалены политикой хранения), затем агрегаты удаляются
+    сверху вниз и создаются заново в create_rollups.
+    """
+    global rollups_refresh_needed
+
+    raw_view = next((view for view, _bucket, source, *_ in ROLLUPS if source == "temperature"), None)
+    if raw_view is None:
+        return
+
+    with conn, conn.cursor() as cur:
+        cur.execute(
+            "SELECT view_definition FROM timescaledb_information.continuous_aggregates WHERE view_name = %s;",
+            (raw_view,)
+        )
+        row = cur.fetchone()
+        # В прежнем определении нет COALESCE(min_value, value) и т.п.
+        if row is None or "coalesce" in row[0].lower():
+            return
+
+        logging.warning(f"Continuous aggregate {raw_view} ignores window summaries, recreating rollups")
+
+        columns = "bucket, sensor_id, min_value, max_value, avg_value, sample_count, sum_value"
+        views = [view for view, *_ in ROLLUPS]
+        for view in views:
+            cur.execute("SELECT to_regclass(%s) IS NOT NULL;", (view,))
+            if not cur.fetchone()[0]:
+                continue
+            cur.execute(f"CREATE TABLE IF NOT EXISTS {view}_legacy AS SELECT {columns} FROM {view} WITH NO DATA;")
+            cur.execute(f"INSERT INTO {view}_legacy ({columns}) SELECT {columns} FROM {view};")
+            logging.warning(f"Rows of continuous aggregate {view} are kept in {view}_legacy")
+
+        for view in reversed(views):
+            cur.execute(f"DROP MATERIALIZED VIEW IF EXISTS {view};")
+
+    rollups_refresh_needed = True
+
+
+def create_rollups(conn):
+    """
+    Создаёт непрерывные агрегаты (continuous aggregates) по сенсорам
+    с корзинами 1 минута / 1 час / 1 день и политики их обновления.
+    Каждый агрегат хранит min/max/avg/count (и sum для точного
+    среднего в агрегатах верхнего уровня), поэтому запросы за месяцы
+    читают тысячи предагрегированных строк вместо миллионов сырых.
+    Все операции идемпотентны и выполняются при каждом старте.
+    """
+    # Агрегаты прежнего определения (без учёта сводок окна) пересоздаются
+    drop_stale_rollups(conn)
+
+    # CREATE MATERIALIZED VIEW ... WITH (timescaledb.continuous)
+    # нельзя выполнять внутри транзакции
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cur:
+            for view, bucket, source, start_offset, end_offset, schedule in ROLLUPS:
+                if source == "temperature":
+                    # Агрегат по сырым данным: сводка окна учитывается своими min/max
+                    # и весом sample_count, одиночное показание — как окно из одного значения
+                    select = f"""
+                        SELECT time_bucket(INTERVAL '{bucket}', time) AS bucket,
+                               sensor_id,
+                               min(COALESCE(min_value, value)) AS min_value,
+                               max(COALESCE(max_value, value)) AS max_value,
+                               sum(value * COALESCE(sample_count, 1)) / sum(COALESCE(sample_count, 1)) AS avg_value,
+                               sum(COALESCE(sample_count, 1)) AS sample_count,
+                               sum(value * COALESCE(sample_count, 1)) AS sum_value
+                        FROM temperature
+                        GROUP BY 1, sensor_id
+                    """
+                else:
+                    # Агрегат по агрегату нижнего уровня (иерархический)
+                    select = f"""
+                        SELECT time_bucket(INTERVAL '{bucket}', bucket) AS bucket,
+                               sensor_id,
+                               min(min_value) AS min_value,
+                               max(max_value) AS max_value,
+                               sum(sum_value) / sum(sample_count) AS avg_value,
+                               sum(sample_count) AS sample_count,
+                               sum(sum_value) AS sum_value
+                        FROM {source}
+                        GROUP BY 1, sensor_id
+                    """
+
+                cur.execute(f"""
+                    CREATE MATERIALIZED VIEW IF NOT EXISTS {view}
+                    WITH (timescaledb.continuous) AS
+                    {select}
+                    WITH NO DATA;
+                """)
+
+                # Политика фонового обновления агрегата
+                cur.execute(
+                    """
+                    SELECT add_continuous_aggregate_policy(
+                        %s,
+                        start_offset => %s::interval,
+                        end_offset => %s::interval,
+                        schedule_interval => %s::interval,
+                        if_not_exists => TRUE
+                    );
+                    """,
+                    (view, start_offset, end_offset, schedule)
+                )
+
+                logging.info(f"Continuous aggregate {view} is ready (bucket {bucket})")
+    finally:
+        conn.autocommit = False
+
+
+def apply_storage_policies(conn):
+    """
+    Применяет к hypertable temperature настройки из переменных окружения:
+    - нативное сжатие (segmentby = sensor_id, orderby = time) для чанков
+      старше COMPRESS_AFTER_DAYS дней;
+    - удаление сырых чанков старше RETENTION_DAYS дней.
+
+    Политики пересоздаются при каждом старте, поэтому изменённые
+    значения переменных вступают в силу после перезапуска.
+    Удаление включается, только если сырые данные к этому моменту
+    уже гарантированно учтены в агрегатах (срок хранения больше
+    окна обновления минутного агрегата).
+    """
+    with conn, conn.cursor() as cur:
+        cur.execute("""
+            SELECT compression_enabled
+            FROM timescaledb_information.hypertables
+            WHERE hypertable_name = 'temperature';
+        """)
+        compression_enabled = cur.fetchone()[0]
+
+        # Настройки сжатия задаются один раз: после появления сжатых чанков
+        # TimescaleDB не позволяет их менять
+        if COMPRESSION_ENABLED and not compression_enabled:
+            cur.execute("""
+                ALTER TABLE temperature SET (
+                    timescaledb.compress,
+                    timescaledb.compress_segmentby = 'sensor_id',
+                    timescaledb.compress_orderby = 'time DESC'
+                );
+            """)
+            compression_enabled = True
+
+        if compression_enabled:
+            cur.execute("SELECT remove_compression_policy('temperature', if_exists => TRUE);")
+        if COMPRESSION_ENABLED:
+            cur.execute(
+                "SELECT add_compression_policy('temperature', make_interval(days => %s));",
+                (COMPRESS_AFTER_DAYS,)
+            )
+            logging.info(f"Compression policy: chunks older than {COMPRESS_AFTER_DAYS} days")
+
+        cur.execute("SELECT remove_retention_policy('temperature', if_exists => TRUE);")
+        if RETENTION_DAYS > 0:
+            raw_rollups = [r for r in ROLLUPS if r[2] == "temperature"]
+            covered = True
+            if ROLLUPS_ENABLED and raw_rollups:
+                # Сырые данные нельзя удалять, пока они попадают в окно обновления агрегата:
+                # иначе обновление затрёт уже посчитанные корзины
+                cur.execute(
+                    "SELECT make_interval(days => %s) > %s::interval;",
+                    (RETENTION_DAYS, raw_rollups[0][3])
+                )
+                covered = cur.fetchone()[0]
+            elif not ROLLUPS_ENABLED:
+                logging.warning("Retention is enabled without rollups: old raw data will be lost")
+
+            if covered:
+                cur.execute(
+                    "SELECT add_retention_policy('temperature', make_interval(days => %s));",
+                    (RETENTION_DAYS,)
+                )
+                logging.info(f"Retention policy: raw chunks older than {RETENTION_DAYS} days")
+            else:
+                logging.error(
+                    f"RETENTION_DAYS={RETENTION_DAYS} does not exceed the rollup refresh window; "
+                    f"retention policy is not applied"
+                )
+
+
+def resolve_sensor_ids(conn, names):
+    """
+    Возвращает словарь имя сенсора -> sensors.id для всех имён из names.
+    Известные идентификаторы берутся из кэша процесса; новые сенсоры
+    регистрируются в sensors одной отдельной транзакцией
+    (ON CONFLICT — на случай гонки с другими потоками и процессами).
+    """
+    with sensor_ids_lock:
+        missing = [name for name in names if name not in sensor_ids]
+
+    if missing:
+        with conn, conn.cursor() as cur:
+            cur.execute(
+                """
+                INSERT INTO sensors (name)
+                SELECT unnest(%s::text[])
+                ON CONFLICT (name) DO NOTHING;
+                """,
+                (missing,)
+            )
+            cur.execute("SELECT name, id FROM sensors WHERE name = ANY(%s);", (missing,))
+            registered = dict(cur.fetchall())
+
+        with sensor_ids_lock:
+            sensor_ids.update(registered)
+        logging.info(f"Registered sensors: {registered}")
+
+    with sensor_ids_lock:
+        return {name: sensor_ids[name] for name in names}
+
+
+def write_rows(conn, rows):
+    """
+    Записывает пакет строк (time, sensor, value, min, max, count) в таблицу temperature одной транзакцией:
+    COPY ... FROM STDIN (формат CSV) во временную таблицу, затем
+    INSERT ... ON CONFLICT DO NOTHING — дубликаты (sensor_id, time)
+    пропускаются, в том числе внутри одного пакета.
+    Имена сенсоров предварительно заменяются на sensor_id.
+    Возвращает число вставленных строк.
+    При ошибке транзакция откатывается и исключение пробрасывается выше.
+    """
+    ids = resolve_sensor_ids(conn, {row[1] for row in rows})
+
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    for timestamp, sensor, value, minimum, maximum, count in rows:
+        # Пустое поле CSV записывается как NULL
+        writer.writerow((
+            timestamp.isoformat(), ids[sensor], repr(value),
+            "" if minimum is None else repr(minimum),
+            "" if maximum is None else repr(maximum),
+            "" if count is None else count,
+        ))
+    buf.seek(0)
+
+    # Контекстный менеджер соединения делает COMMIT или ROLLBACK
+    with conn, conn.cursor() as cur:
+        # Временная таблица живёт в сессии соединения и очищается при COMMIT
+        cur.execute("""
+            CREATE TEMP TABLE IF NOT EXISTS temperature_staging
+            (LIKE temperature INCLUDING DEFAULTS) ON COMMIT DELETE ROWS;
+        """)
+        cur.copy_expert(
+            "COPY temperature_staging (time, sensor_id, value, min_value, max_value, sample_count) "
+            "FROM STDIN WITH (FORMAT csv)",
+            buf
+        )
+        cur.execute("""
+            INSERT INTO temperature (time, sensor_id, value, min_value, max_value, sample_count)
+            SELECT time, sensor_id, value, min_value, max_value, sample_count FROM temperature_staging
+            ON CONFLICT (sensor_id, time) DO NOTHING;
+        """)
+        inserted = cur.rowcount
+
+    rows_written.inc(inserted)
+    return inserted
+
+
+def collect_batch():
+    """
+    Забирает из очереди пакет строк: ждёт первую строку,
+    затем добирает до BATCH_MAX_ROWS строк, но не дольше BATCH_MAX_AGE_MS.
+    """
+    rows = [ingest_queue.get()]
+    deadline = time.monotonic() + BATCH_MAX_AGE_MS / 1000.0
+
+    while len(rows) < BATCH_MAX_ROWS:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        try:
+            rows.append(ingest_queue.get(timeout=remaining))
+        except queue.Empty:
+            break
+
+    return rows
+
+
+def db_worker(worker_id):
+    """
+    Поток записи в БД: собирает пакеты из очереди и записывает их
+    через соединение из пула. Подтверждения MQTT (PUBACK)
+    отправляются только после COMMIT, поэтому пакетная запись
+    не добавляет новых способов потерять данные.
+    """
+    pending = None
+
+    while True:
+        # Пакет, который не удалось записать, повторяется до успеха
+        rows = pending or collect_batch()
+        pending = None
+        records = [record for record, _mid, _qos, _generation in rows]
+
+        started = time.monotonic()
+        try:
+            if spool is None:
+                run_in_db(write_rows, records)
+            elif not db_available.is_set() or not write_or_spool(records):
+                spool_rows(records)
+                logging.warning(f"Worker {worker_id}: database unavailable, spooled {len(rows)} rows")
+        except Exception as e:
+            logging.error(f"Worker {worker_id}: failed to write batch of {len(rows)} rows: {e}")
+            pending = rows
+            time.sleep(1)
+            continue
+
+        # Подтверждаем сообщения только после успешного COMMIT (или fsync спула)
+        ack_rows(rows)
+
+        # Строки из спула учитываются в агрегатах при его воспроизведении
+        if ROLLUPS_ENABLED and db_available.is_set():
+            oldest = min(record[0] for record in records)
+            if oldest.timestamp() < time.time() - LATE_ROWS_AGE:
+                note_late_rows(oldest, max(record[0] for record in records))
+        dedup.add_many(
+            (sensor, round(timestamp.timestamp() * 1000))
+            for timestamp, sensor, *_ in records
+        )
+
+        duration = time.monotonic() - started
+        now = time.time()
+        batch_size.observe(len(rows))
+        flush_seconds.observe(duration)
+        lag_seconds.observe_many([now - record[0].timestamp() for record in records])
+
+        logging.info(
+            f"Worker {worker_id}: saved batch: rows={len(rows)}, "
+            f"duration={duration * 1000:.1f} ms"
+        )
+
+
+def write_or_spool(rows):
+    """
+    Пытается записать пакет в БД за DB_WRITE_ATTEMPTS попыток.
+    Возвращает False, если БД недоступна: тогда признак db_available
+    сбрасывается, и следующие пакеты сразу пишутся в спул,
+    пока поток replay_spool не убедится, что БД снова доступна.
+    """
+    try:
+        run_in_db(write_rows, rows, attempts=DB_WRITE_ATTEMPTS)
+        return True
+    except (psycopg2.OperationalError, psycopg2.InterfaceError):
+        db_available.clear()
+        return False
+
+
+def spool_rows(rows):
+    """
+    Сохраняет пакет в локальный спул (с fsync).
+    """
+    spool.append(
+        (round(timestamp.timestamp() * 1000), sensor, value, minimum, maximum, count)
+        for timestamp, sensor, value, minimum, maximum, count in rows
+    )
+    rows_spooled.inc(len(rows))
+
+
+def ack_rows(rows):
+    """
+    Подтверждает сообщения записанного пакета.
+    Идентификаторы сообщений (mid) действуют в пределах одного MQTT-подключения:
+    строки, принятые до переподключения, не подтверждаются, иначе PUBACK
+    мог бы подтвердить другое сообщение нового подключения с тем же mid.
+    Брокер доставит такие сообщения повторно, и фильтр дублей подтвердит их без записи.
+    """
+    with connection_lock:
+        for _record, mid, qos, generation in rows:
+            if generation == connection_generation:
+                client.ack(mid, qos)
+
+
+def check_db(conn):
+    """
+    Проверка доступности БД простым запросом.
+    """
+    with conn, conn.cursor() as cur:
+        cur.execute("SELECT 1;")
+
+
+def replay_spool():
+    """
+    Фоновый поток: когда БД снова доступна, воспроизводит спул
+    пакетами по SPOOL_REPLAY_BATCH строк со скоростью не более
+    SPOOL_REPLAY_RATE строк/с, чтобы догоняющая запись после сбоя
+    не перегрузила БД. Прогресс выводится в лог. Если БД снова
+    стала недоступна, воспроизведение продолжается с той же позиции
+    при следующей проверке.
+    """
+    position = (None, 0)
+
+    while True:
+        time.sleep(SPOOL_CHECK_INTERVAL)
+
+        if not spool.segments() and db_available.is_set():
+            continue
+
+        try:
+            run_in_db(check_db, attempts=1)
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            continue
+
+        if not db_available.is_set():
+            logging.info("Database is available again, new batches are written directly")
+            db_available.set()
+
+        segments = spool.seal()
+        total_bytes = sum(os.path.getsize(path) for path in segments)
+        done_bytes = 0
+        replayed = 0
+        started = time.monotonic()
+
+        try:
+            for path in segments:
+                offset = position[1] if position[0] == path else 0
+                done_bytes += offset
+
+                while True:
+                    records, next_offset = Spool.read(path, offset, SPOOL_REPLAY_BATCH)
+                    if not records:
+                        break
+
+                    rows = [
+                        (datetime.fromtimestamp(timestamp_ms / 1000.0, tz=timezone.utc), sensor, *summary)
+                        for timestamp_ms, sensor, *summary in records
+                    ]
+                    run_in_db(write_rows, rows, attempts=DB_WRITE_ATTEMPTS)
+                    if ROLLUPS_ENABLED:
+                        note_late_rows(min(row[0] for row in rows), max(row[0] for row in rows))
+
+                    done_bytes += next_offset - offset
+                    offset = next_offset
+                    position = (path, offset)
+                    replayed += len(rows)
+
+                    logging.info(
+                        f"Spool replay: {replayed} rows, "
+                        f"{done_bytes * 100 // max(total_bytes, 1)}% of {total_bytes} bytes"
+                    )
+
+                    # Ограничение скорости: ждём, пока средняя скорость не опустится до лимита
+                    ahead = replayed / SPOOL_REPLAY_RATE - (time.monotonic() - started)
+                    if ahead > 0:
+                        time.sleep(ahead)
+
+                Spool.remove(path)
+                position = (None, 0)
+
+            # Воспроизведённые строки в основном старше окна политик обновления агрегатов
+            refresh_late_rows()
+        except (psycopg2.OperationalError, psycopg2.InterfaceError) as e:
+            db_available.clear()
+            logging.warning(f"Spool replay interrupted: {e}")
+        except psycopg2.Error as e:
+            # БД отклонила пакет: повторяем при следующей проверке
+            logging.error(f"Spool replay failed: {e}")
+        except Exception:
+            # Ошибка в коде не исправится повтором: завершаем процесс, чтобы сбой был виден
+            # (супервизор или Docker перезапустит его). Спул на диске не теряется,
+            # неподтверждённые сообщения брокер доставит заново.
+            logging.critical("Spool replay crashed, exiting", exc_info=True)
+            os._exit(1)
+
+
+def queue_depth():
+    """
+    Возвращает текущее число сообщений, ожидающих записи в БД.
+    """
+    return ingest_queue.qsize()
+
+
+def report_queue_depth():
+    """
+    Фоновый поток: периодически выводит глубину очереди в лог.
+    """
+    while True:
+        time.sleep(QUEUE_REPORT_INTERVAL)
+        logging.info(f"Ingest queue depth: {queue_depth()}/{QUEUE_MAX_SIZE}")
+
+
+def subscription_topic():
+    """
+    Возвращает фильтр подписки с учётом режима масштабирования:
+    при нескольких писателях в режиме shared — $share/<группа>/<топик>.
+    """
+    if writer_count > 1 and SHARD_MODE == "shared":
+        return f"$share/{SHARE_GROUP}/{MQTT_TOPIC}"
+    return MQTT_TOPIC
+
+
+def owns_sensor(sensor):
+    """
+    В режиме affinity сообщает, обрабатывает ли текущий писатель этот сенсор.
+    """
+    if writer_count <= 1 or SHARD_MODE != "affinity":
+        return True
+    return zlib.crc32(sensor.encode("utf-8")) % writer_count == writer_index
+
+
+def on_connect(client, userdata, flags, reason_code, properties=None):
     """
     Запускается при подключении к MQTT-брокеру.
-    Если rc == 0 — подключение успешное.
+    Если reason_code == 0 — подключение успешное.
     Выполняется подписка на указанный топик.
     """
-    if rc == 0:
+    global connection_generation
+
+    if reason_code == 0:
+        with connection_lock:
+            connection_generation += 1
+
         logging.info(f"Connected to MQTT broker at {MQTT_HOST}:{MQTT_PORT}")
 
-        client.subscribe(MQTT_TOPIC, qos=1)
-        logging.info(f"Subscribed to topic '{MQTT_TOPIC}'")
+        topic = subscription_topic()
+        client.subscribe(topic, qos=1)
+        logging.info(f"Writer {writer_index}/{writer_count}: subscribed to topic '{topic}'")
     else:
-        logging.error(f"Failed to connect to MQTT broker with code {rc}")
+        logging.error(f"Failed to connect to MQTT broker with code {reason_code}")
+
+
+def on_subscribe(client, userdata, mid, reason_code_list, properties=None):
+    """
+    Проверяет SUBACK: если брокер отклонил подписку (например, не поддерживает
+    shared subscriptions), писатель не получит ни одного сообщения.
+    """
+    for reason_code in reason_code_list:
+        if reason_code.is_failure:
+            logging.error(
+                f"Writer {writer_index}/{writer_count}: broker rejected subscription "
+                f"'{subscription_topic()}': {reason_code}"
+            )
 
 
 def on_message(client, userdata, msg):
     """
-    Обрабатывает каждое входящее сообщение MQTT:
-    - парсит JSON
+    Обрабатывает каждое входящее сообщение MQTT в сетевом потоке paho:
+    - разбирает payload общим кодеком (payload.decode)
     - извлекает время и значение датчика
-    - записывает данные в базу TimescaleDB
+    - кладёт строку в очередь; запись в БД выполняют потоки db_worker
+
+    Обращений к БД здесь нет, поэтому медленный Postgres не задерживает
+    keepalive и PINGRESP. Брокер не присылает больше QUEUE_MAX_SIZE
+    неподтверждённых сообщений (Receive Maximum), поэтому очередь
+    не переполняется; если это всё же произошло, put() блокирует
+    чтение из сокета до освобождения места.
     """
-    try:
-        # Декодируем JSON-пакет
-        payload = json.loads(msg.payload.decode())
+    messages_received.inc()
 
-        value = payload.get('value')
-        timestamp_ms = payload.get('timestamp')
+    try:
+        # Имя сенсора берётся из последней части MQTT-топика
+        sensor = msg.topic.split('/')[-1]
 
-        # Проверка корректности данных
-        if value is None or timestamp_ms is None:
-            logging.warning(f"Skipping message with missing fields: {msg.payload}")
+        # Режим affinity: чужие сенсоры подтверждаем без разбора payload
+        if not owns_sensor(sensor):
+            client.ack(msg.mid, msg.qos)
             return
 
-        # Конвертация timestamp из миллисекунд в datetime
-        timestamp = datetime.utcfromtimestamp(int(timestamp_ms) / 1000.0)
+        # Разбор и проверка payload общим кодеком (JSON или двоичный — по content_type)
+        reading = decode(msg.payload, content_type_of(msg.properties))
+        if reading.timestamp is None:
+            raise PayloadError("field 'timestamp' is missing")
 
-        # Имя сенсора берётся из последней части MQTT-топика
-        sensor = msg.topic.split('/')[-1]
+        # Для сводки окна, агрегированной на сенсоре, value — среднее,
+        # а min/max/count записываются в столбцы сводки
+        value = reading.value
+        timestamp_ms = reading.timestamp
 
-        # Запись в базу
-        with conn.cursor() as cur:
-            cur.execute(
-                "INSERT INTO temperature (time, sensor, value) VALUES (%s, %s, %s);",
-                (timestamp, sensor, float(value))
-            )
+        # Повторная доставка уже записанного показания: подтверждаем и пропускаем
+        if dedup.seen((sensor, timestamp_ms)):
+            messages_duplicate.inc()
+            client.ack(msg.mid, msg.qos)
+            return
+
+        # Конвертация timestamp из миллисекунд в datetime (UTC)
+        timestamp = datetime.fromtimestamp(timestamp_ms / 1000.0, tz=timezone.utc)
+
+        # Передача строки потокам записи; подтверждение — после записи пакета
+        record = (timestamp, sensor, value, reading.min, reading.max, reading.count)
+        ingest_queue.put((record, msg.mid, msg.qos, connection_generation))
+        messages_parsed.inc()
 
-        logging.info(f"Saved data: sensor={sensor}, value={value}, time={timestamp}")
+    except PayloadError as e:
+        logging.warning(f"Skipping malformed message on {msg.topic}: {e}")
+        messages_rejected.inc()
+        # Некорректное сообщение подтверждаем сразу, иначе брокер будет присылать его снова
+        client.ack(msg.mid, msg.qos)
 
     except Exception as e:
         logging.error(f"Failed to process message: {e}")
+        messages_rejected.inc()
+        client.ack(msg.mid, msg.qos)
 
 
 # -----------------------------------------
-# Основная функция
+# Запуск процессов записи
 # -----------------------------------------
-def main():
+def bootstrap_schema():
     """
-    Запускает приложение:
-    - подключение к БД
-    - создание таблицы
+    Создаёт таблицы, непрерывные агрегаты и применяет политики
+    сжатия и хранения.
+    """
+    run_in_db(create_table)
+    if ROLLUPS_ENABLED:
+        run_in_db(create_rollups)
+        if rollups_refresh_needed:
+            run_in_db(refresh_rollups)
+    run_in_db(apply_storage_policies)
+
+
+def run_writer(index, count, bootstrap=True):
+    """
+    Запускает один процесс записи:
+    - создание пула соединений с БД (и схемы, если bootstrap)
+    - запуск потоков записи в БД и воспроизведения спула
+    - запуск эндпоинта /metrics
     - запуск MQTT-клиента
     """
+    global client, spool, writer_index, writer_count
+
+    writer_index, writer_count = index, count
+
     connect_db()
-    create_table()
+    if bootstrap:
+        bootstrap_schema()
 
-    client = mqtt.Client()
+    # MQTT 5 + manual_ack: PUBACK отправляется вручную после записи пакета в БД,
+    # а Receive Maximum ограничивает число неподтверждённых сообщений ёмкостью очереди
+    client = mqtt.Client(
+        callback_api_version=CallbackAPIVersion.VERSION2,
+        protocol=mqtt.MQTTv5,
+        manual_ack=True
+    )
     client.on_connect = on_connect
+    client.on_subscribe = on_subscribe
     client.on_message = on_message
 
-    # Подключаемся к брокеру и запускаем бесконечный цикл обработки сообщений
-    client.connect(MQTT_HOST, MQTT_PORT, 60)
-    client.loop_forever()
+    connect_properties = Properties(PacketTypes.CONNECT)
+    connect_properties.ReceiveMaximum = min(QUEUE_MAX_SIZE, 65535)
+
+    if SPOOL_ENABLED:
+        # У каждого писателя свой каталог спула
+        spool_dir = SPOOL_DIR if count == 1 else os.path.join(SPOOL_DIR, f"writer-{index}")
+        spool = Spool(spool_dir, SPOOL_SEGMENT_BYTES)
+        threading.Thread(target=replay_spool, daemon=True).start()
+
+    if ROLLUPS_ENABLED:
+        threading.Thread(target=refresh_late_rows_periodically, daemon=True).start()
+
+    for worker_id in range(DB_WORKERS):
+        threading.Thread(target=db_worker, args=(worker_id,), daemon=True).start()
+
+    if QUEUE_REPORT_INTERVAL > 0:
+        threading.Thread(target=report_queue_depth, daemon=True).start()
+
+    if METRICS_PORT > 0:
+        start_http_server(metrics, METRICS_PORT + index)
+
+    # Подключаемся к брокеру; сетевой цикл paho работает в своём потоке (loop_start),
+    # поэтому PUBACK из потоков записи ставятся в очередь и отправляются этим потоком,
+    # а не пишутся в сокет параллельно с ним
+    client.connect(MQTT_HOST, MQTT_PORT, 60, properties=connect_properties)
+    client.loop_start()
+
+    # Основной поток только ждёт: вся работа идёт в фоновых потоках
+    threading.Event().wait()
+
+
+def supervise():
+    """
+    Локальный супервизор: один раз создаёт схему БД, затем запускает
+    WRITER_PROCESSES процессов записи и перезапускает упавшие.
+    Каждый процесс использует своё ядро CPU, своё MQTT-подключение
+    и свой пул соединений с БД.
+    """
+    connect_db()
+    bootstrap_schema()
+    # Соединения не должны наследоваться дочерними процессами
+    db_pool.closeall()
+
+    processes = {}
+    while True:
+        for index in range(WRITER_PROCESSES):
+            process = processes.get(index)
+            if process is not None and process.is_alive():
+                continue
+            if process is not None:
+                logging.error(f"Writer {index} exited with code {process.exitcode}, restarting")
+
+            process = multiprocessing.Process(
+                target=run_writer,
+                args=(index, WRITER_PROCESSES, False),
+                name=f"db_writer-{index}",
+                daemon=True
+            )
+            process.start()
+            processes[index] = process
+            logging.info(f"Started writer {index} (pid {process.pid})")
+
+        time.sleep(5)
+
+
+# -----------------------------------------
+# Основная функция
+# -----------------------------------------
+def main():
+    """
+    Запускает приложение: супервизор с WRITER_PROCESSES процессами
+    записи или один писатель с номером WRITER_INDEX из WRITER_COUNT
+    (например, при запуске N контейнеров).
+    """
+    if SHARD_MODE not in SHARD_MODES:
+        raise ValueError(f"Unknown SHARD_MODE '{SHARD_MODE}', expected one of {', '.join(SHARD_MODES)}")
+
+    if WRITER_PROCESSES > 1:
+        supervise()
+    else:
+        run_writer(WRITER_INDEX, WRITER_COUNT)
 
 
 # -----------------------------------------
@@ -0,0 +1,145 @@
+import glob
+import logging
+import os
+import struct
+import threading
+
+# -----------------------------------------
+# Формат записи в спуле
+# -----------------------------------------
+# Заголовок записи: timestamp (мс, int64), значение (float64), длина имени сенсора (uint16).
+# За заголовком следует имя сенсора в UTF-8.
+RECORD_HEADER = struct.Struct("<qdH")
+
+# Старший бит длины имени помечает сводку окна: за именем следуют min, max (float64)
+# и число значений (uint32). Сегменты прежнего формата этот бит не используют.
+SUMMARY_FLAG = 0x8000
+SUMMARY_TRAILER = struct.Struct("<ddI")
+
+# Шаблон имени файла сегмента
+SEGMENT_PATTERN = "segment-{:010d}.spool"
+
+
+class Spool:
+    """
+    Локальный журнал (спул) строк, которые не удалось записать в БД.
+
+    Журнал только дополняется и разбит на сегменты: запись идёт
+    в активный сегмент, при превышении segment_bytes открывается
+    следующий. Воспроизведение читает закрытые сегменты от старых
+    к новым и удаляет каждый после полной записи в БД.
+    """
+
+    def __init__(self, directory, segment_bytes):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+        segments = self.segments()
+        self.next_seq = self._seq(segments[-1]) + 1 if segments else 0
+        self.active = None
+        self.active_path = None
+
+    @staticmethod
+    def _seq(path):
+        return int(os.path.basename(path)[len("segment-"):-len(".spool")])
+
+    def segments(self):
+        """
+        Возвращает пути всех сегментов, от старых к новым.
+        """
+        return sorted(glob.glob(os.path.join(self.directory, "segment-*.spool")))
+
+    def _open_segment(self):
+        self.active_path = os.path.join(self.directory, SEGMENT_PATTERN.format(self.next_seq))
+        self.active = open(self.active_path, "ab", buffering=1024 * 1024)
+        self.next_seq += 1
+
+    def _close_segment(self):
+        if self.active is not None:
+            self.active.close()
+            self.active = None
+            self.active_path = None
+
+    def append(self, rows):
+        """
+        Дописывает строки (timestamp_ms, sensor, value, min, max, count) в активный сегмент
+        и сбрасывает их на диск (fsync). Для одиночного показания min, max и count — None. После возврата строки сохранены
+        и соответствующие сообщения MQTT можно подтверждать.
+        """
+        with self.lock:
+            if self.active is None:
+                self._open_segment()
+
+            for timestamp_ms, sensor, value, minimum, maximum, count in rows:
+                name = sensor.encode("utf-8")
+                if count is None:
+                    self.active.write(RECORD_HEADER.pack(timestamp_ms, value, len(name)))
+                    self.active.write(name)
+                else:
+                    self.active.write(RECORD_HEADER.pack(timestamp_ms, value, len(name) | SUMMARY_FLAG))
+                    self.active.write(name)
+                    self.active.write(SUMMARY_TRAILER.pack(minimum, maximum, count))
+
+            self.active.flush()
+            os.fsync(self.active.fileno())
+
+            if self.active.tell() >= self.segment_bytes:
+                self._close_segment()
+
+    def seal(self):
+        """
+        Закрывает активный сегмент, чтобы его можно было воспроизвести.
+        Возвращает список закрытых сегментов, от старых к новым.
+        """
+        with self.lock:
+            self._close_segment()
+            return self.segments()
+
+    def pending_bytes(self):
+        """
+        Возвращает общий размер сегментов на диске (в байтах).
+        """
+        return sum(os.path.getsize(path) for path in self.segments())
+
+    @staticmethod
+    def read(path, offset, max_rows):
+        """
+        Читает из сегмента до max_rows строк (timestamp_ms, sensor, value, min, max, count),
+        начиная с позиции offset.
+        Возвращает (строки, позиция следующей строки).
+        Недописанная запись в конце сегмента (сбой во время записи)
+        отбрасывается.
+        """
+        rows = []
+        with open(path, "rb") as f:
+            f.seek(offset)
+            while len(rows) < max_rows:
+                header = f.read(RECORD_HEADER.size)
+                if len(header) < RECORD_HEADER.size:
+                    break
+                timestamp_ms, value, name_len = RECORD_HEADER.unpack(header)
+                summary = name_len & SUMMARY_FLAG
+                name_len &= ~SUMMARY_FLAG
+                name = f.read(name_len)
+                if len(name) < name_len:
+                    break
+                minimum = maximum = count = None
+                if summary:
+                    trailer = f.read(SUMMARY_TRAILER.size)
+                    if len(trailer) < SUMMARY_TRAILER.size:
+                        break
+                    minimum, maximum, count = SUMMARY_TRAILER.unpack(trailer)
+                rows.append((timestamp_ms, name.decode("utf-8"), value, minimum, maximum, count))
+                offset = f.tell()
+
+        return rows, offset
+
+    @staticmethod
+    def remove(path):
+        """
+        Удаляет полностью воспроизведённый сегмент.
+        """
+        os.remove(path)
+        logging.info(f"Spool segment {os.path.basename(path)} replayed and removed")
@@ -0,0 +1,214 @@
+import json
+import logging
+import os
+import threading
+import time
+
+# Поддерживаемые операторы сравнения: значение <оператор> порог → превышение
+OPERATORS = {
+    ">": lambda value, threshold: value > threshold,
+    ">=": lambda value, threshold: value >= threshold,
+    "<": lambda value, threshold: value < threshold,
+    "<=": lambda value, threshold: value <= threshold,
+}
+
+
+class Rule:
+    """
+    Правило алерта: фильтр MQTT-топика (с шаблонами + и #),
+    оператор и порог, параметры гистерезиса/задержки/повтора
+    и адресаты уведомлений.
+    """
+
+    __slots__ = (
+        "name", "topic_filter", "operator", "threshold", "hysteresis",
+        "for_sec", "renotify_sec", "recipients", "breached",
+    )
+
+    def __init__(self, name, topic_filter, operator, threshold, hysteresis,
+                 for_sec, renotify_sec, recipients):
+        if operator not in OPERATORS:
+            raise ValueError(f"Unsupported operator '{operator}' in rule '{name}'")
+
+        self.name = name
+        self.topic_filter = topic_filter
+        self.operator = operator
+        self.threshold = float(threshold)
+        self.hysteresis = float(hysteresis)
+        self.for_sec = float(for_sec)
+        self.renotify_sec = float(renotify_sec)
+        self.recipients = recipients
+        self.breached = OPERATORS[operator]
+
+    def recovered(self, value):
+        """
+        Вернулось ли значение в норму с учётом гистерезиса
+        (для > и >= — ниже порога минус гистерезис, для < и <= — выше порога плюс гистерезис).
+        """
+        if self.operator in (">", ">="):
+            return value < self.threshold - self.hysteresis
+        return value > self.threshold + self.hysteresis
+
+
+class TopicTrie:
+    """
+    Префиксное дерево фильтров MQTT-топиков.
+
+    Поиск правил для топика проходит по уровням топика и на каждом
+    уровне проверяет только точное совпадение, «+» и «#», поэтому
+    стоимость зависит от глубины топика, а не от числа правил.
+    """
+
+    __slots__ = ("children", "rules", "wildcard_rules")
+
+    def __init__(self):
+        # уровень фильтра (в т.ч. "+") -> поддерево
+        self.children = {}
+        # правила, фильтр которых заканчивается на этом узле
+        self.rules = []
+        # правила с фильтром "<префикс>/#"
+        self.wildcard_rules = []
+
+    def insert(self, topic_filter, rule):
+        node = self
+        levels = topic_filter.split("/")
+        for i, level in enumerate(levels):
+            if level == "#":
+                if i != len(levels) - 1:
+                    raise ValueError(f"'#' must be the last level in filter '{topic_filter}'")
+                node.wildcard_rules.append(rule)
+                return
+            child = node.children.get(level)
+            if child is None:
+                child = node.children[level] = TopicTrie()
+            node = child
+        node.rules.append(rule)
+
+    def match(self, topic):
+        """
+        Возвращает список правил, фильтры которых совпадают с топиком.
+        """
+        matched = []
+        self._match(topic.split("/"), 0, matched)
+        return matched
+
+    def _match(self, levels, depth, matched):
+        # "#" совпадает и с текущим уровнем, и с родительским ("a/#" совпадает с "a")
+        matched.extend(self.wildcard_rules)
+
+        if depth == len(levels):
+            matched.extend(self.rules)
+            return
+
+        child = self.children.get(levels[depth])
+        if child is not None:
+            child._match(levels, depth + 1, matched)
+
+        plus = self.children.get("+")
+        if plus is not None:
+            plus._match(levels, depth + 1, matched)
+
+
+def load_rules(path, defaults):
+    """
+    Читает правила из файла JSON или YAML (по расширению .yaml/.yml;
+    для YAML нужен пакет PyYAML) и компилирует их в TopicTrie.
+
+    Формат: {"rules": [{"topic": "temperature/+", "operator": ">",
+    "threshold": 25, ...}, ...]} или просто список правил.
+    Отсутствующие поля берутся из defaults.
+
+    Состояние алерта хранится по имени правила, поэтому имена должны быть уникальны.
+    Имя по умолчанию строится из содержимого правила ("temperature/+ > 25"),
+    а не из его позиции в файле: вставка правила выше не переносит состояние на другое правило.
+    Возвращает TopicTrie и множество имён правил.
+    """
+    with open(path, "rb") as f:
+        if path.endswith((".yaml", ".yml")):
+            import yaml
+            data = yaml.safe_load(f)
+        else:
+            data = json.load(f)
+
+    items = data.get("rules", []) if isinstance(data, dict) else data
+
+    trie = TopicTrie()
+    names = set()
+    for item in items:
+        options = dict(defaults, **item)
+        recipients = options["recipients"]
+        if isinstance(recipients, (list, tuple)):
+            recipients = ", ".join(recipients)
+
+        name = options.get("name") or f"{options['topic']} {options['operator']} {float(options['threshold']):g}"
+        if name in names:
+            raise ValueError(f"Duplicate rule name '{name}' (set a unique 'name' for each rule)")
+        names.add(name)
+
+        rule = Rule(
+            name=name,
+            topic_filter=options["topic"],
+            operator=options["operator"],
+            threshold=options["threshold"],
+            hysteresis=options["hysteresis"],
+            for_sec=options["for_sec"],
+            renotify_sec=options["renotify_sec"],
+            recipients=recipients,
+        )
+        trie.insert(rule.topic_filter, rule)
+
+    return trie, names
+
+
+class RulesWatcher:
+    """
+    Следит за файлом правил и перечитывает его при изменении
+    (по времени модификации) без перезапуска процесса.
+    Если новый файл некорректен, продолжают действовать старые правила.
+    """
+
+    def __init__(self, path, defaults, interval):
+        self.path = path
+        self.defaults = defaults
+        self.interval = interval
+        self.mtime = None
+        self.trie = TopicTrie()
+        # Имена действующих правил (по ним очищаются состояния удалённых правил)
+        self.rule_names = frozenset()
+
+    def reload(self):
+        """
+        Перечитывает файл, если он изменился. Возвращает True при успешной загрузке.
+        """
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError as e:
+            logging.error(f"Cannot access rules file {self.path}: {e}")
+            return False
+
+        if mtime == self.mtime:
+            return False
+
+        try:
+            trie, names = load_rules(self.path, self.defaults)
+        except Exception as e:
+            logging.error(f"Failed to load rules from {self.path}, keeping previous rules: {e}")
+            self.mtime = mtime
+            return False
+
+        # Замена ссылки атомарна: обработчик сообщений видит либо старые, либо новые правила.
+        # Имена заменяются раньше дерева: увидев новое дерево, обработчик увидит и новые имена
+        self.rule_names = frozenset(names)
+        self.trie = trie
+        self.mtime = mtime
+        logging.info(f"Loaded {len(names)} alert rules from {self.path}")
+        return True
+
+    def start(self):
+        self.reload()
+        threading.Thread(target=self.run, daemon=True).start()
+
+    def run(self):
+        while True:
+            time.sleep(self.interval)
+            self.reload()
@@ -0,0 +1,104 @@
+from array import array
+import math
+
+
+class RingBuffer:
+    """
+    Кольцевой буфер фиксированного размера поверх array('d'):
+    память выделяется один раз, добавление — O(1).
+    """
+
+    __slots__ = ("values", "size", "index", "count")
+
+    def __init__(self, size):
+        self.values = array("d", bytes(8 * size))
+        self.size = size
+        # Позиция следующей записи
+        self.index = 0
+        # Число заполненных ячеек (не больше size)
+        self.count = 0
+
+    def push(self, value):
+        """
+        Добавляет значение и возвращает вытесненное (или None, пока буфер не заполнен).
+        """
+        evicted = self.values[self.index] if self.count == self.size else None
+        self.values[self.index] = value
+        self.index += 1
+        if self.index == self.size:
+            self.index = 0
+        if self.count < self.size:
+            self.count += 1
+        return evicted
+
+
+class SensorDetector:
+    """
+    Потоковые детекторы аномалий для одного сенсора.
+
+    Для каждого нового значения за O(1) вычисляет оценки:
+    - zscore — |x - mean| / stddev по скользящему окну предыдущих значений;
+    - rate   — скорость изменения, °C в минуту, относительно предыдущего значения;
+    - stuck  — сколько значений подряд не меняется.
+
+    Сумма и сумма квадратов окна поддерживаются инкрементально
+    и пересчитываются заново при каждом полном обороте буфера,
+    чтобы не накапливалась ошибка округления.
+    """
+
+    __slots__ = ("window", "total", "total_sq", "min_samples",
+                 "last_value", "last_time", "repeats", "since_recompute")
+
+    def __init__(self, window_size, min_samples):
+        self.window = RingBuffer(window_size)
+        self.total = 0.0
+        self.total_sq = 0.0
+        self.min_samples = min_samples
+        self.last_value = None
+        self.last_time = None
+        self.repeats = 0
+        self.since_recompute = 0
+
+    def update(self, value, now):
+        """
+        Обрабатывает новое значение (now — время в секундах)
+        и возвращает оценки (zscore, rate, stuck).
+        """
+        window = self.window
+
+        # z-score считается по окну до добавления нового значения
+        zscore = 0.0
+        if window.count >= self.min_samples:
+            mean = self.total / window.count
+            variance = max(self.total_sq / window.count - mean * mean, 0.0)
+            stddev = math.sqrt(variance)
+            if stddev > 0:
+                zscore = abs(value - mean) / stddev
+
+        rate = 0.0
+        if self.last_time is not None and now > self.last_time:
+            rate = abs(value - self.last_value) / (now - self.last_time) * 60.0
+
+        if value == self.last_value:
+            self.repeats += 1
+        else:
+            self.repeats = 1
+
+        evicted = window.push(value)
+        self.total += value
+        self.total_sq += value * value
+        if evicted is not None:
+            self.total -= evicted
+            self.total_sq -= evicted * evicted
+
+        self.since_recompute += 1
+        if self.since_recompute >= window.size:
+            values = window.values[:window.count]
+            self.total = math.fsum(values)
+            self.total_sq = math.fsum(v * v for v in values)
+            self.since_recompute = 0
+
+        self.last_value = value
+        self.last_time = now
+
+        return zscore, rate, self.repeats
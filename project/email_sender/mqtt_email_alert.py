@@ -1,9 +1,14 @@
+from alert_rules import Rule, RulesWatcher, TopicTrie
+from anomaly import SensorDetector
 from email.message import EmailMessage
-import json
+from paho.mqtt.client import CallbackAPIVersion
+from payload import PayloadError, content_type_of, decode
 import logging
 import os
 import paho.mqtt.client as mqtt
+import queue
 import smtplib
+import threading
 import time
 
 # -----------------------------------------
@@ -24,6 +29,40 @@ MQTT_TOPIC = os.getenv("MQTT_TOPIC", "temperature/#")
 # Порог температуры: при превышении отправляется email-алерт
 TEMPERATURE_THRESHOLD = float(os.getenv("TEMPERATURE_THRESHOLD", "25.0"))
 
+# Гистерезис: алерт снимается, только когда температура опустится
+# ниже TEMPERATURE_THRESHOLD - ALERT_HYSTERESIS
+ALERT_HYSTERESIS = float(os.getenv("ALERT_HYSTERESIS", "1.0"))
+
+# Сколько секунд превышение должно длиться, прежде чем алерт сработает
+ALERT_FOR_SEC = float(os.getenv("ALERT_FOR_SEC", "0"))
+
+# Интервал повторного уведомления, пока алерт активен (в секундах, 0 — не повторять)
+ALERT_RENOTIFY_SEC = float(os.getenv("ALERT_RENOTIFY_SEC", "3600"))
+
+# Файл правил алертов (JSON или YAML). Если не задан — действует одно правило
+# "значение > TEMPERATURE_THRESHOLD" для всего MQTT_TOPIC.
+ALERT_RULES_FILE = os.getenv("ALERT_RULES_FILE", "")
+
+# Интервал проверки изменений файла правил (в секундах)
+ALERT_RULES_RELOAD_SEC = float(os.getenv("ALERT_RULES_RELOAD_SEC", "5"))
+
+# -----------------------------------------
+# Потоковые детекторы аномалий
+# -----------------------------------------
+# Включённые детекторы через запятую: zscore, rate, stuck (пусто — выключены)
+ANOMALY_DETECTORS = [
+    name.strip() for name in os.getenv("ANOMALY_DETECTORS", "").split(",") if name.strip()
+]
+
+# Размер скользящего окна (число значений) и минимум значений для z-score
+ANOMALY_WINDOW = int(os.getenv("ANOMALY_WINDOW", "60"))
+ANOMALY_MIN_SAMPLES = int(os.getenv("ANOMALY_MIN_SAMPLES", "10"))
+
+# Пороги: z-score, скорость изменения (°C/мин), число одинаковых значений подряд
+ANOMALY_ZSCORE = float(os.getenv("ANOMALY_ZSCORE", "3.0"))
+ANOMALY_RATE = float(os.getenv("ANOMALY_RATE", "5.0"))
+ANOMALY_STUCK = int(os.getenv("ANOMALY_STUCK", "30"))
+
 # -----------------------------------------
 # Параметры SMTP (Mailpit, Postfix, etc.)
 # -----------------------------------------
@@ -32,78 +71,446 @@ SMTP_PORT = int(os.getenv("SMTP_PORT", "1025"))
 EMAIL_FROM = os.getenv("EMAIL_FROM", "alert@example.com")
 EMAIL_TO = os.getenv("EMAIL_TO", "user@example.com")
 
+# -----------------------------------------
+# Параметры фоновой отправки писем
+# -----------------------------------------
+# Ёмкость очереди писем: при переполнении новые письма отбрасываются (с ошибкой в логе),
+# MQTT-цикл никогда не ждёт SMTP
+EMAIL_QUEUE_SIZE = int(os.getenv("EMAIL_QUEUE_SIZE", "1000"))
+
+# Если за DIGEST_WINDOW_SEC секунд накопилось больше DIGEST_THRESHOLD писем,
+# они объединяются в одно письмо-дайджест
+DIGEST_WINDOW_SEC = float(os.getenv("DIGEST_WINDOW_SEC", "2"))
+DIGEST_THRESHOLD = int(os.getenv("DIGEST_THRESHOLD", "5"))
 
-def send_email(subject: str, body: str):
+# Число попыток отправки письма (с переподключением к SMTP между попытками)
+SMTP_ATTEMPTS = int(os.getenv("SMTP_ATTEMPTS", "3"))
+
+
+# -----------------------------------------
+# Состояния алерта
+# -----------------------------------------
+OK = "OK"
+FIRING = "FIRING"
+RESOLVED = "RESOLVED"
+
+
+class AlertState:
     """
-    Отправляет email через указанный SMTP-сервер.
-    Используется для алертов о превышении температуры.
+    Состояние алерта для пары (топик, правило): OK → FIRING → RESOLVED (→ OK).
+
+    - OK → FIRING: порог правила нарушен непрерывно не меньше for_sec секунд;
+    - FIRING → RESOLVED: значение вернулось за порог с учётом гистерезиса;
+    - RESOLVED → OK: следующее нормальное значение (без уведомления);
+    - RESOLVED → FIRING: новое нарушение (с учётом for_sec).
+
+    Письмо отправляется один раз на каждый переход в FIRING и RESOLVED,
+    а пока алерт активен — не чаще раза в renotify_sec секунд.
     """
-    msg = EmailMessage()
-    msg['From'] = EMAIL_FROM
-    msg['To'] = EMAIL_TO
-    msg['Subject'] = subject
-    msg.set_content(body)
 
-    try:
-        # Подключение к SMTP-серверу и отправка сообщения
-        with smtplib.SMTP(SMTP_HOST, SMTP_PORT) as s:
-            s.send_message(msg)
+    __slots__ = ("state", "breach_since", "last_notified")
 
-        logging.info(f"Sent alert email to {EMAIL_TO}")
-    except Exception as e:
-        logging.error(f"Failed to send email: {e}")
+    def __init__(self):
+        self.state = OK
+        # Момент начала текущего превышения (time.monotonic()) или None
+        self.breach_since = None
+        # Момент последнего уведомления по активному алерту
+        self.last_notified = None
+
+    def update(self, value, now, rule):
+        """
+        Обрабатывает новое значение по правилу rule и возвращает событие,
+        о котором нужно уведомить: "firing", "renotify", "resolved" или None.
+        """
+        if self.state == FIRING:
+            if rule.recovered(value):
+                self.state = RESOLVED
+                self.breach_since = None
+                self.last_notified = None
+                return "resolved"
+            if rule.renotify_sec > 0 and now - self.last_notified >= rule.renotify_sec:
+                self.last_notified = now
+                return "renotify"
+            return None
+
+        # Состояния OK и RESOLVED
+        if not rule.breached(value, rule.threshold):
+            self.breach_since = None
+            self.state = OK
+            return None
 
+        if self.breach_since is None:
+            self.breach_since = now
+        if now - self.breach_since >= rule.for_sec:
+            self.state = FIRING
+            self.last_notified = now
+            return "firing"
+        return None
 
-def on_connect(client, userdata, flags, rc):
+
+# Состояния алертов: (топик, имя правила) -> AlertState
+alert_states = {}
+
+# Значения по умолчанию для полей правил из файла
+RULE_DEFAULTS = {
+    "topic": MQTT_TOPIC,
+    "operator": ">",
+    "threshold": TEMPERATURE_THRESHOLD,
+    "hysteresis": ALERT_HYSTERESIS,
+    "for_sec": ALERT_FOR_SEC,
+    "renotify_sec": ALERT_RENOTIFY_SEC,
+    "recipients": EMAIL_TO,
+}
+
+
+def default_rules():
+    """
+    Правила без файла: одно правило "значение > TEMPERATURE_THRESHOLD"
+    для всего MQTT_TOPIC.
+    """
+    trie = TopicTrie()
+    trie.insert(MQTT_TOPIC, Rule(name="default", topic_filter=MQTT_TOPIC, **{
+        key: value for key, value in RULE_DEFAULTS.items() if key != "topic"
+    }))
+    return trie
+
+
+def anomaly_rules():
+    """
+    Правила для детекторов аномалий: сравнивается не температура,
+    а оценка детектора, поэтому к ним применима та же машина состояний
+    (гистерезис, повторные уведомления).
+    """
+    common = dict(
+        topic_filter=MQTT_TOPIC,
+        operator=">=",
+        for_sec=0,
+        renotify_sec=ALERT_RENOTIFY_SEC,
+        recipients=EMAIL_TO,
+    )
+    rules = {
+        "zscore": Rule(name="anomaly-zscore", threshold=ANOMALY_ZSCORE, hysteresis=1.0, **common),
+        "rate": Rule(name="anomaly-rate", threshold=ANOMALY_RATE, hysteresis=ANOMALY_RATE / 2, **common),
+        # Снимается, как только значение изменилось: серия сбрасывается до 1,
+        # а 1 < ANOMALY_STUCK - (ANOMALY_STUCK - 2)
+        "stuck": Rule(name="anomaly-stuck", threshold=ANOMALY_STUCK, hysteresis=ANOMALY_STUCK - 2, **common),
+    }
+    unknown = set(ANOMALY_DETECTORS) - set(rules)
+    if unknown:
+        raise ValueError(f"Unknown anomaly detectors: {', '.join(sorted(unknown))}")
+    # Серия из одного значения есть у любого показания: алерт срабатывал бы всегда и не снимался
+    if "stuck" in ANOMALY_DETECTORS and ANOMALY_STUCK < 2:
+        raise ValueError(f"ANOMALY_STUCK must be at least 2, got {ANOMALY_STUCK}")
+    return [(name, rules[name]) for name in ("zscore", "rate", "stuck") if name in ANOMALY_DETECTORS]
+
+
+# Включённые детекторы аномалий и детекторы по топикам
+ANOMALY_RULES = anomaly_rules()
+sensor_detectors = {}
+
+# Источник правил: RulesWatcher (файл с горячей перезагрузкой) или правила по умолчанию
+rules_watcher = None
+static_rules = default_rules()
+
+
+def current_rules():
+    return rules_watcher.trie if rules_watcher is not None else static_rules
+
+
+def current_rule_names():
+    return rules_watcher.rule_names if rules_watcher is not None else {"default"}
+
+
+# Правила, для которых последний раз очищались состояния алертов
+pruned_rules = None
+
+
+def prune_alert_states():
+    """
+    Удаляет состояния алертов правил, которых нет в перезагруженном файле,
+    чтобы они не копились и не достались новому правилу с тем же именем.
+    Состояния детекторов аномалий сохраняются.
+    """
+    keep = set(current_rule_names()) | {rule.name for _name, rule in ANOMALY_RULES}
+    stale = [key for key in alert_states if key[1] not in keep]
+    for key in stale:
+        del alert_states[key]
+    if stale:
+        logging.info(f"Dropped {len(stale)} alert states of removed rules")
+
+
+class EmailDispatcher:
+    """
+    Фоновая отправка писем.
+
+    Письма кладутся в ограниченную очередь и отправляются отдельным
+    потоком через одно постоянное SMTP-соединение (с переподключением
+    при обрыве). Если за DIGEST_WINDOW_SEC секунд накопилось больше
+    DIGEST_THRESHOLD писем одному адресату, они объединяются в дайджест.
+    """
+
+    def __init__(self):
+        self.queue = queue.Queue(maxsize=EMAIL_QUEUE_SIZE)
+        self.smtp = None
+
+    def start(self):
+        threading.Thread(target=self.run, daemon=True).start()
+
+    def submit(self, subject: str, body: str, recipients: str = EMAIL_TO):
+        """
+        Ставит письмо в очередь; никогда не блокирует вызывающий поток.
+        """
+        try:
+            self.queue.put_nowait((subject, body, recipients))
+        except queue.Full:
+            logging.error(f"Email queue is full, dropping alert: {subject}")
+
+    def collect(self):
+        """
+        Ждёт первое письмо и добирает те, что придут в течение DIGEST_WINDOW_SEC.
+        """
+        items = [self.queue.get()]
+        deadline = time.monotonic() + DIGEST_WINDOW_SEC
+
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                items.append(self.queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+
+        return items
+
+    def run(self):
+        while True:
+            items = self.collect()
+
+            # Группировка по адресатам: дайджест собирается для каждого адресата отдельно
+            by_recipients = {}
+            for subject, body, recipients in items:
+                by_recipients.setdefault(recipients, []).append((subject, body))
+
+            for recipients, alerts in by_recipients.items():
+                if len(alerts) > DIGEST_THRESHOLD:
+                    subject = f"Temperature Alerts Digest: {len(alerts)} alerts"
+                    body = "\n\n".join(f"{s}\n{b}" for s, b in alerts)
+                    self.send(subject, body, recipients)
+                else:
+                    for subject, body in alerts:
+                        self.send(subject, body, recipients)
+
+    def connect(self):
+        self.close()
+        self.smtp = smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=30)
+        logging.info(f"Connected to SMTP server at {SMTP_HOST}:{SMTP_PORT}")
+
+    def close(self):
+        if self.smtp is not None:
+            try:
+                self.smtp.quit()
+            except Exception:
+                pass
+            self.smtp = None
+
+    def send(self, subject: str, body: str, recipients: str):
+        """
+        Отправляет письмо через постоянное SMTP-соединение.
+        При обрыве соединения переподключается и повторяет попытку.
+        """
+        msg = EmailMessage()
+        msg['From'] = EMAIL_FROM
+        msg['To'] = recipients
+        msg['Subject'] = subject
+        msg.set_content(body)
+
+        for attempt in range(1, SMTP_ATTEMPTS + 1):
+            try:
+                if self.smtp is None:
+                    self.connect()
+                self.smtp.send_message(msg)
+                logging.info(f"Sent alert email to {recipients}: {subject}")
+                return
+            except (smtplib.SMTPServerDisconnected, OSError) as e:
+                logging.warning(f"SMTP connection error (attempt {attempt}/{SMTP_ATTEMPTS}): {e}")
+                self.close()
+                time.sleep(attempt)
+            except Exception as e:
+                logging.error(f"Failed to send email: {e}")
+                return
+
+        logging.error(f"Failed to send email after {SMTP_ATTEMPTS} attempts: {subject}")
+
+
+# Фоновая отправка писем
+dispatcher = EmailDispatcher()
+
+
+def send_email(subject: str, body: str, recipients: str = EMAIL_TO):
+    """
+    Ставит email в очередь на отправку через указанный SMTP-сервер.
+    Используется для алертов о превышении температуры.
+    """
+    dispatcher.submit(subject, body, recipients)
+
+
+def on_connect(client, userdata, flags, reason_code, properties=None):
     """
     Вызывается при подключении к брокеру.
-    rc == 0 → подключение успешно.
+    reason_code == 0 → подключение успешно.
     После успешного подключения подписываемся на топик.
     """
-    if rc == 0:
+    if reason_code == 0:
         logging.info(f"Connected to MQTT broker at {MQTT_HOST}:{MQTT_PORT}")
 
         # Подписка на выбранный топик (можно использовать шаблоны: temperature/#)
         client.subscribe(MQTT_TOPIC, qos=1)
         logging.info(f"Subscribed to topic '{MQTT_TOPIC}'")
     else:
-        logging.error(f"Failed to connect to MQTT broker with code {rc}")
+        logging.error(f"Failed to connect to MQTT broker with code {reason_code}")
+
+
+def notify(event: str, topic: str, value: float, rule: Rule, score: float = None):
+    """
+    Формирует и отправляет письмо о событии алерта адресатам правила.
+    Для детекторов аномалий передаётся оценка детектора score.
+    """
+    if score is not None:
+        status = "Resolved" if event == "resolved" else "Detected"
+        subject = f"Temperature Anomaly {status}: {rule.name} on {topic}"
+        body = (
+            f"Detector '{rule.name}': score {score:.2f} (threshold {rule.threshold}).\n"
+            f"Value: {value}\n"
+            f"Topic: {topic}"
+        )
+    elif event == "resolved":
+        subject = f"Temperature Resolved: {value}°C on {topic}"
+        body = (
+            f"Temperature is back to normal for rule '{rule.name}' "
+            f"(value {rule.operator} {rule.threshold}°C, hysteresis {rule.hysteresis}°C).\n"
+            f"Value: {value}\n"
+            f"Topic: {topic}"
+        )
+    else:
+        prefix = "Temperature Alert" if event == "firing" else "Temperature Alert (still firing)"
+        subject = f"{prefix}: {value}°C on {topic}"
+        body = (
+            f"Rule '{rule.name}' triggered: value {rule.operator} {rule.threshold}°C.\n"
+            f"Value: {value}\n"
+            f"Topic: {topic}"
+        )
+    send_email(subject, body, rule.recipients)
+
+
+def rule_value(reading, rule: Rule):
+    """
+    Значение, с которым сравнивается порог правила.
+    Для сводки окна, агрегированной на сенсоре, берётся экстремум
+    в сторону порога (max для > и >=, min для < и <=),
+    чтобы кратковременный выброс внутри окна не терялся в среднем.
+    """
+    if reading.count is None:
+        return reading.value
+    return reading.max if rule.operator in (">", ">=") else reading.min
 
 
 def on_message(client, userdata, msg):
     """
-    Получает сообщение из MQTT, парсит JSON или числовое значение,
-    сравнивает температуру с порогом и отправляет email при превышении.
+    Получает сообщение из MQTT, разбирает JSON, числовое значение
+    или двоичный payload (по content_type) общим кодеком,
+    находит правила для топика и обновляет состояние алерта по каждому.
+    Письмо отправляется только при смене состояния (и при повторном
+    уведомлении), а не на каждое значение выше порога.
     """
-    try:
-        # Пытаемся интерпретировать payload как JSON
-        payload = json.loads(msg.payload.decode())
+    global pruned_rules
 
-        # Получение температуры. Если payload — число, используем его напрямую.
-        temp_value = payload.get("value") or float(payload)
+    try:
+        # Payload — JSON-объект {"value": ...}, голое число (значение 0 корректно)
+        # или двоичное показание, если сенсор указал это в content_type
+        reading = decode(msg.payload, content_type_of(msg.properties))
+        temp_value = reading.value
 
         logging.info(f"Received temperature {temp_value} on topic {msg.topic}")
 
-        # Проверка: превышена ли температура
-        if float(temp_value) > TEMPERATURE_THRESHOLD:
-            subject = f"Temperature Alert: {temp_value}°C on {msg.topic}"
-            body = (
-                f"Temperature exceeded threshold {TEMPERATURE_THRESHOLD}°C.\n"
-                f"Value: {temp_value}\n"
-                f"Topic: {msg.topic}"
-            )
-            send_email(subject, body)
+        now = time.monotonic()
+
+        # Правила перезагружены: состояния удалённых правил больше не нужны
+        rules = current_rules()
+        if rules is not pruned_rules:
+            prune_alert_states()
+            pruned_rules = rules
+
+        # Обновление состояния алерта по каждому подходящему правилу
+        for rule in rules.match(msg.topic):
+            key = (msg.topic, rule.name)
+            state = alert_states.get(key)
+            if state is None:
+                state = alert_states[key] = AlertState()
+
+            value = rule_value(reading, rule)
+            event = state.update(value, now, rule)
+            if event is not None:
+                logging.info(f"Alert {event} on topic {msg.topic}, rule '{rule.name}' (state {state.state})")
+                notify(event, msg.topic, value, rule)
+
+        if ANOMALY_RULES:
+            # Скорость изменения считается по времени измерения: при пачке показаний
+            # (повторная доставка, разбор очереди неотправленных) время прихода почти одинаково
+            reading_time = reading.timestamp / 1000 if reading.timestamp is not None else now
+            check_anomalies(msg.topic, temp_value, now, reading_time)
+
+    except PayloadError as e:
+        logging.warning(f"Skipping malformed message on {msg.topic}: {e}")
 
     except Exception as e:
         logging.error(f"Error processing message: {e}")
 
 
+def check_anomalies(topic: str, value: float, now: float, reading_time: float):
+    """
+    Обновляет детекторы аномалий сенсора и состояния их алертов.
+    now — время обработки (time.monotonic()) для машины состояний алертов,
+    reading_time — время измерения в секундах для детекторов.
+    """
+    detector = sensor_detectors.get(topic)
+    if detector is None:
+        detector = sensor_detectors[topic] = SensorDetector(ANOMALY_WINDOW, ANOMALY_MIN_SAMPLES)
+
+    zscore, rate, stuck = detector.update(value, reading_time)
+    scores = {"zscore": zscore, "rate": rate, "stuck": stuck}
+
+    for name, rule in ANOMALY_RULES:
+        key = (topic, rule.name)
+        state = alert_states.get(key)
+        if state is None:
+            state = alert_states[key] = AlertState()
+
+        event = state.update(scores[name], now, rule)
+        if event is not None:
+            logging.info(f"Anomaly {event} on topic {topic}, detector '{name}' (score {scores[name]:.2f})")
+            notify(event, topic, value, rule, scores[name])
+
+
 # -----------------------------------------
 # Основная функция — запуск MQTT-клиента
 # -----------------------------------------
 def main():
-    # Создаём MQTT-клиента
-    client = mqtt.Client()
+    global rules_watcher
+
+    # Запускаем фоновую отправку писем
+    dispatcher.start()
+
+    # Загружаем правила из файла и следим за его изменениями
+    if ALERT_RULES_FILE:
+        rules_watcher = RulesWatcher(ALERT_RULES_FILE, RULE_DEFAULTS, ALERT_RULES_RELOAD_SEC)
+        rules_watcher.start()
+
+    # Создаём MQTT-клиента (MQTT 5: формат payload приходит в content_type)
+    client = mqtt.Client(
+        callback_api_version=CallbackAPIVersion.VERSION2,
+        protocol=mqtt.MQTTv5
+    )
 
     # Привязываем callback-функции
     client.on_connect = on_connect
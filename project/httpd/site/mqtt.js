@@ -34,16 +34,40 @@ document.addEventListener('DOMContentLoaded', () => {
     client.on('message', (topic, message, packet) => {
         let payload;
 
-        // Пытаемся распарсить JSON из сообщения
-        try {
-            payload = JSON.parse(message.toString());
-        } catch (e) {
-            console.error('Failed to parse message payload as JSON:', e);
-            return;
+        // Двоичный формат (content_type из свойств MQTT 5), little-endian:
+        // 16 байт — float64 значение + int64 timestamp (мс);
+        // 36 байт — сводка окна: то же + float64 min + float64 max + uint32 count
+        const contentType = packet.properties && packet.properties.contentType;
+        if (contentType === 'application/vnd.sensor-reading.v1') {
+            if (message.length !== 16 && message.length !== 36) {
+                console.error('Unexpected binary payload length:', message.length);
+                return;
+            }
+            const view = new DataView(message.buffer, message.byteOffset, message.length);
+            payload = {
+                value: view.getFloat64(0, true),
+                timestamp: Number(view.getBigInt64(8, true))
+            };
+            if (message.length === 36) {
+                payload.min = view.getFloat64(16, true);
+                payload.max = view.getFloat64(24, true);
+                payload.count = view.getUint32(32, true);
+            }
+        } else {
+            // Пытаемся распарсить JSON из сообщения
+            try {
+                payload = JSON.parse(message.toString());
+            } catch (e) {
+                console.error('Failed to parse message payload as JSON:', e);
+                return;
+            }
         }
 
-        // Извлекаем значение температуры
-        const temp = payload.value !== undefined ? String(payload.value) : '--';
+        // Извлекаем значение температуры; для сводки окна — среднее и диапазон min…max
+        let temp = payload.value !== undefined ? String(payload.value) : '--';
+        if (payload.count !== undefined) {
+            temp += ` (${payload.min}…${payload.max}, n=${payload.count})`;
+        }
         const timestamp = payload.timestamp;
 
         // Определяем имя сенсора из топика: temperature/<sensor>
@@ -0,0 +1,93 @@
+class WindowAggregator:
+    """
+    Сводка замеров за окно window_ms: min, max, среднее и число замеров.
+
+    Замер, пришедший после окончания окна, закрывает текущее окно
+    (возвращается его сводка) и открывает следующее.
+    """
+
+    __slots__ = ("window_ms", "started", "last_timestamp", "minimum", "maximum", "total", "count")
+
+    def __init__(self, window_ms):
+        self.window_ms = window_ms
+        self.started = None
+        self.last_timestamp = None
+        self.minimum = 0.0
+        self.maximum = 0.0
+        self.total = 0.0
+        self.count = 0
+
+    def add(self, value, timestamp):
+        """
+        Добавляет замер; возвращает сводку закрытого окна
+        (mean, timestamp, min, max, count) или None.
+        """
+        summary = None
+        if self.started is not None and timestamp - self.started >= self.window_ms:
+            summary = self.flush()
+
+        if self.count == 0:
+            self.started = timestamp
+            self.minimum = self.maximum = value
+        elif value < self.minimum:
+            self.minimum = value
+        elif value > self.maximum:
+            self.maximum = value
+
+        self.total += value
+        self.count += 1
+        self.last_timestamp = timestamp
+        return summary
+
+    def flush(self):
+        """
+        Закрывает текущее окно и возвращает его сводку (None, если замеров нет).
+        Метка времени сводки — время последнего замера окна.
+        """
+        if self.count == 0:
+            return None
+
+        # Ошибка округления не должна вывести среднее за пределы [min, max]
+        mean = min(max(self.total / self.count, self.minimum), self.maximum)
+        summary = (mean, self.last_timestamp, self.minimum, self.maximum, self.count)
+
+        self.started = None
+        self.total = 0.0
+        self.count = 0
+        return summary
+
+
+class Deadband:
+    """
+    Отчёт по зоне нечувствительности: замер публикуется, если он отличается
+    от последнего опубликованного больше чем на epsilon или с последней
+    публикации прошло heartbeat_ms (чтобы отсутствие изменений
+    не выглядело как отказ сенсора).
+    """
+
+    __slots__ = ("epsilon", "heartbeat_ms", "last_value", "last_timestamp", "suppressed")
+
+    def __init__(self, epsilon, heartbeat_ms):
+        self.epsilon = epsilon
+        self.heartbeat_ms = heartbeat_ms
+        self.last_value = None
+        self.last_timestamp = None
+        # Сколько замеров подряд не опубликовано
+        self.suppressed = 0
+
+    def add(self, value, timestamp):
+        """
+        Возвращает True, если замер нужно опубликовать.
+        """
+        if (
+            self.last_value is None
+            or abs(value - self.last_value) > self.epsilon
+            or timestamp - self.last_timestamp >= self.heartbeat_ms
+        ):
+            self.last_value = value
+            self.last_timestamp = timestamp
+            self.suppressed = 0
+            return True
+
+        self.suppressed += 1
+        return False
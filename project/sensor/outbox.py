@@ -0,0 +1,76 @@
+import sqlite3
+import threading
+
+
+class Outbox:
+    """
+    Ограниченная персистентная очередь показаний (SQLite).
+    Для сводок окна дополнительно хранятся min, max и число замеров.
+
+    Показание остаётся в очереди, пока брокер не подтвердит его (PUBACK),
+    поэтому переживает обрыв связи и перезапуск процесса.
+    Порядок — по возрастанию id (порядок добавления).
+    При переполнении удаляются самые старые показания.
+    """
+
+    def __init__(self, path, max_size):
+        self.max_size = max_size
+        # Сколько показаний удалено из-за переполнения
+        self.dropped = 0
+        self.lock = threading.Lock()
+
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS outbox ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " timestamp INTEGER NOT NULL,"
+            " value REAL NOT NULL,"
+            " min_value REAL,"
+            " max_value REAL,"
+            " sample_count INTEGER)"
+        )
+        self.size = self.conn.execute("SELECT count(*) FROM outbox").fetchone()[0]
+
+    def append(self, timestamp, value, minimum=None, maximum=None, count=None):
+        """
+        Добавляет показание (или сводку окна); при переполнении удаляет самые старые.
+        """
+        with self.lock:
+            self.conn.execute(
+                "INSERT INTO outbox (timestamp, value, min_value, max_value, sample_count) VALUES (?, ?, ?, ?, ?)",
+                (timestamp, value, minimum, maximum, count)
+            )
+            self.size += 1
+
+            if self.size > self.max_size:
+                excess = self.size - self.max_size
+                self.conn.execute(
+                    "DELETE FROM outbox WHERE id IN (SELECT id FROM outbox ORDER BY id LIMIT ?)",
+                    (excess,)
+                )
+                self.size -= excess
+                self.dropped += excess
+
+    def peek(self, after_id, limit):
+        """
+        Возвращает до limit показаний (id, timestamp, value, min, max, count) с id больше after_id.
+        """
+        with self.lock:
+            return self.conn.execute(
+                "SELECT id, timestamp, value, min_value, max_value, sample_count"
+                " FROM outbox WHERE id > ? ORDER BY id LIMIT ?",
+                (after_id, limit)
+            ).fetchall()
+
+    def remove(self, row_id):
+        """
+        Удаляет подтверждённое показание (если оно ещё не вытеснено).
+        """
+        with self.lock:
+            removed = self.conn.execute("DELETE FROM outbox WHERE id = ?", (row_id,)).rowcount
+            self.size -= removed
+
+    def __len__(self):
+        return self.size
@@ -1,9 +1,20 @@
+from collections import Counter
+from edge import Deadband, WindowAggregator
+from outbox import Outbox
 from paho.mqtt.client import CallbackAPIVersion
-import json
+from paho.mqtt.packettypes import PacketTypes
+from paho.mqtt.properties import Properties
+from payload import (
+    CONTENT_TYPE_BINARY, CONTENT_TYPE_JSON, encode, encode_binary, encode_summary, encode_summary_binary
+)
+from value_models import MODELS, make_model
 import logging
 import os
 import paho.mqtt.client as mqtt
+import queue
 import random
+import signal
+import threading
 import time
 
 # -----------------------------------------
@@ -29,6 +40,109 @@ MQTT_RETAIN = os.getenv("MQTT_RETAIN", "true").lower() == "true"
 # Интервал публикации новых данных (в секундах)
 PUBLISH_INTERVAL = int(os.getenv("PUBLISH_INTERVAL", "60"))
 
+# Задержка перед первым подключением (даёт брокеру время на запуск)
+STARTUP_DELAY = int(os.getenv("STARTUP_DELAY", str(PUBLISH_INTERVAL)))
+
+# Режим работы: single — один сенсор (по умолчанию), load — генератор нагрузки
+SENSOR_MODE = os.getenv("SENSOR_MODE", "single").lower()
+if SENSOR_MODE not in ("single", "load"):
+    raise ValueError(f"Unsupported SENSOR_MODE '{SENSOR_MODE}', expected single or load")
+
+# Формат payload: json (по умолчанию) или binary — 16 байт (float64 значение + int64 мс).
+# Формат передаётся подписчикам в свойстве MQTT 5 content_type.
+PAYLOAD_FORMAT = os.getenv("PAYLOAD_FORMAT", "json").lower()
+if PAYLOAD_FORMAT not in ("json", "binary"):
+    raise ValueError(f"Unsupported PAYLOAD_FORMAT '{PAYLOAD_FORMAT}', expected json or binary")
+
+# Кодирование показания и сводки окна выбранным форматом
+encode_reading = encode_binary if PAYLOAD_FORMAT == "binary" else encode
+encode_window = encode_summary_binary if PAYLOAD_FORMAT == "binary" else encode_summary
+
+# -----------------------------------------
+# Отчётность на сенсоре (SENSOR_MODE=single)
+# -----------------------------------------
+# every     — публиковать каждый замер раз в PUBLISH_INTERVAL (по умолчанию);
+# aggregate — замерять раз в SAMPLE_INTERVAL и раз в PUBLISH_INTERVAL публиковать
+#             сводку окна: среднее, min, max и число замеров;
+# deadband  — замерять раз в SAMPLE_INTERVAL и публиковать, только если значение
+#             изменилось больше чем на DEADBAND или прошло HEARTBEAT_INTERVAL
+REPORT_MODE = os.getenv("REPORT_MODE", "every").lower()
+if REPORT_MODE not in ("every", "aggregate", "deadband"):
+    raise ValueError(f"Unsupported REPORT_MODE '{REPORT_MODE}', expected every, aggregate or deadband")
+
+# Внутренний интервал замеров для aggregate и deadband (в секундах)
+SAMPLE_INTERVAL = float(os.getenv("SAMPLE_INTERVAL", "1"))
+
+# Модель значений сенсора: uniform (случайные целые 10..40), walk, diurnal, spikes
+VALUE_MODEL = os.getenv("VALUE_MODEL", "uniform")
+if VALUE_MODEL not in MODELS:
+    raise ValueError(f"Unknown VALUE_MODEL '{VALUE_MODEL}', expected one of {', '.join(MODELS)}")
+
+# Зона нечувствительности для deadband (°C)
+DEADBAND = float(os.getenv("DEADBAND", "0.5"))
+
+# Максимальный интервал без публикации в режиме deadband (в секундах)
+HEARTBEAT_INTERVAL = float(os.getenv("HEARTBEAT_INTERVAL", str(PUBLISH_INTERVAL)))
+
+# -----------------------------------------
+# Доставка показаний: окно in-flight и outbox
+# -----------------------------------------
+# Максимум опубликованных, но ещё не подтверждённых брокером (PUBACK) показаний
+MAX_INFLIGHT = int(os.getenv("MAX_INFLIGHT", "10"))
+
+# Файл персистентной очереди показаний (SQLite); хранит всё, что ещё не подтверждено
+OUTBOX_PATH = os.getenv("OUTBOX_PATH", "outbox.sqlite")
+
+# Максимум показаний в очереди; при переполнении удаляются самые старые
+OUTBOX_MAX_SIZE = int(os.getenv("OUTBOX_MAX_SIZE", "10000"))
+
+# Скорость отправки из очереди (сообщений в секунду), чтобы после восстановления
+# связи накопленные показания не уходили на брокер одним залпом
+OUTBOX_DRAIN_RATE = float(os.getenv("OUTBOX_DRAIN_RATE", "20"))
+
+# -----------------------------------------
+# Генератор нагрузки (SENSOR_MODE=load)
+# -----------------------------------------
+# Число имитируемых сенсоров
+LOAD_SENSORS = int(os.getenv("LOAD_SENSORS", "100"))
+
+# Суммарная целевая скорость публикации по всем сенсорам (сообщений в секунду)
+LOAD_RATE = float(os.getenv("LOAD_RATE", "1000"))
+
+# Число MQTT-подключений, между которыми распределяются сенсоры
+LOAD_CLIENTS = int(os.getenv("LOAD_CLIENTS", "4"))
+
+# Модели значений через запятую (walk, diurnal, spikes), назначаются сенсорам по кругу
+LOAD_MODELS = [m.strip() for m in os.getenv("LOAD_MODELS", "walk,diurnal,spikes").split(",") if m.strip()]
+for _model in LOAD_MODELS:
+    if _model not in MODELS:
+        raise ValueError(f"Unknown value model '{_model}' in LOAD_MODELS, expected one of {', '.join(MODELS)}")
+
+# Период суточного цикла (в секундах); для коротких тестов можно уменьшить
+LOAD_DIURNAL_PERIOD = float(os.getenv("LOAD_DIURNAL_PERIOD", "86400"))
+
+# Длительность теста (в секундах); 0 — до остановки контейнера
+LOAD_DURATION = float(os.getenv("LOAD_DURATION", "0"))
+
+# Шаблон топика сенсора; {index} — номер сенсора
+LOAD_TOPIC_TEMPLATE = os.getenv("LOAD_TOPIC_TEMPLATE", "temperature/load_{index:05d}")
+
+# QoS публикаций генератора нагрузки
+LOAD_QOS = int(os.getenv("LOAD_QOS", "1"))
+
+# Максимальное отставание от расписания (в секундах): более старые слоты пропускаются,
+# а не догоняются бесконечно, если генератор или брокер не успевают
+LOAD_MAX_LAG = float(os.getenv("LOAD_MAX_LAG", "1.0"))
+
+# Ограничение очереди paho на подключение: при переполнении publish() возвращает ошибку
+LOAD_MAX_QUEUED = int(os.getenv("LOAD_MAX_QUEUED", "10000"))
+
+# Интервал промежуточного отчёта о скорости (в секундах)
+LOAD_REPORT_INTERVAL = float(os.getenv("LOAD_REPORT_INTERVAL", "10"))
+
+# Зерно генератора случайных чисел (пусто — случайное)
+LOAD_SEED = os.getenv("LOAD_SEED", "")
+
 
 def on_connect(client, userdata, flags, reasonCode, properties=None):
     """
@@ -41,7 +155,7 @@ def on_connect(client, userdata, flags, reasonCode, properties=None):
         logging.error(f"Failed to connect, return code {reasonCode}")
 
 
-def on_disconnect(client, userdata, reasonCode, properties=None):
+def on_disconnect(client, userdata, flags, reasonCode, properties=None):
     """
     Вызывается при отключении клиента.
     reasonCode содержит код причины.
@@ -49,82 +163,485 @@ def on_disconnect(client, userdata, reasonCode, properties=None):
     logging.info(f"Disconnected from MQTT broker with code {reasonCode}")
 
 
-def publish_periodically():
+def publish_properties():
+    """
+    Свойства MQTT 5 публикации: content_type и признак формата payload
+    (1 — текст UTF-8 для JSON, 0 — двоичные данные).
+    """
+    properties = Properties(PacketTypes.PUBLISH)
+    if PAYLOAD_FORMAT == "binary":
+        properties.ContentType = CONTENT_TYPE_BINARY
+        properties.PayloadFormatIndicator = 0
+    else:
+        properties.ContentType = CONTENT_TYPE_JSON
+        properties.PayloadFormatIndicator = 1
+    return properties
+
+
+class OutboxPublisher:
+    """
+    Фоновая отправка показаний из outbox в MQTT.
+
+    - Показания публикуются строго по порядку, не быстрее OUTBOX_DRAIN_RATE
+      сообщений в секунду и только пока подключение активно.
+    - Не больше MAX_INFLIGHT показаний ждут подтверждения (PUBACK) одновременно.
+    - Показание удаляется из outbox только после PUBACK; для каждого
+      подтверждения логируется задержка от публикации до PUBACK.
+
+    Состоянием окна владеет только поток отправки: on_publish вызывается
+    paho под его внутренней блокировкой, поэтому лишь кладёт событие в очередь.
+    """
+
+    def __init__(self, client, outbox, max_inflight, drain_rate):
+        self.client = client
+        self.outbox = outbox
+        self.max_inflight = max_inflight
+        self.send_interval = 1.0 / drain_rate
+        self.properties = publish_properties()
+
+        # События для потока отправки: (mid, время PUBACK, reason_code) или None (новое показание)
+        self.events = queue.SimpleQueue()
+        # mid -> (id в outbox, timestamp, value, время публикации)
+        self.inflight = {}
+        # id последнего опубликованного показания
+        self.last_id = 0
+        self.next_send = 0.0
+        self.draining = False
+
+    def start(self):
+        threading.Thread(target=self.run, daemon=True).start()
+
+    def wake(self):
+        """
+        Сообщает о новом показании в outbox.
+        """
+        self.events.put(None)
+
+    def on_connect(self, client, userdata, flags, reasonCode, properties=None):
+        """
+        Callback paho: после (пере)подключения сразу продолжаем отправку из outbox.
+        """
+        on_connect(client, userdata, flags, reasonCode, properties)
+        self.wake()
+
+    def on_publish(self, client, userdata, mid, reason_code, properties=None):
+        """
+        Callback paho: брокер подтвердил публикацию (PUBACK).
+        """
+        self.events.put((mid, time.monotonic(), reason_code))
+
+    def run(self):
+        while True:
+            try:
+                timeout = self.publish_pending()
+            except Exception as e:
+                logging.error(f"Exception during publish: {e}")
+                timeout = 1.0
+
+            try:
+                event = self.events.get(timeout=timeout)
+            except queue.Empty:
+                continue
+
+            # Разбираем все накопившиеся события без ожидания
+            while True:
+                if event is not None:
+                    self.acknowledge(*event)
+                try:
+                    event = self.events.get_nowait()
+                except queue.Empty:
+                    break
+
+    def acknowledge(self, mid, acked_at, reason_code):
+        entry = self.inflight.pop(mid, None)
+        if entry is None:
+            return
+
+        row, sent_at = entry
+        self.outbox.remove(row[0])
+        latency_ms = (acked_at - sent_at) * 1000
+
+        if reason_code.is_failure:
+            logging.error(f"Broker rejected reading ({describe(row)}): {reason_code}, dropped from outbox")
+        else:
+            logging.info(
+                f"Delivered {PAYLOAD_FORMAT} message ({describe(row)}) "
+                f"to topic '{MQTT_TOPIC}' on {MQTT_HOST}:{MQTT_PORT}, "
+                f"ack in {latency_ms:.1f} ms (in flight {len(self.inflight)}, outbox {len(self.outbox)})"
+            )
+
+    def publish_pending(self):
+        """
+        Публикует следующие показания в пределах окна и скорости.
+        Возвращает, сколько секунд можно ждать следующего события.
+        """
+        if not self.client.is_connected():
+            return 1.0
+
+        while len(self.inflight) < self.max_inflight:
+            now = time.monotonic()
+            if now < self.next_send:
+                return self.next_send - now
+
+            rows = self.outbox.peek(self.last_id, 1)
+            if not rows:
+                if self.draining:
+                    logging.info("Outbox drained")
+                    self.draining = False
+                return 1.0
+
+            backlog = len(self.outbox) - len(self.inflight)
+            if backlog > 1 and not self.draining:
+                logging.info(f"Draining outbox backlog of {backlog} readings at {1 / self.send_interval:.0f} msg/s")
+                self.draining = True
+
+            row = rows[0]
+            result = self.client.publish(
+                MQTT_TOPIC,        # Топик
+                encode_row(row),   # Сообщение
+                qos=1,             # Доставка "как минимум один раз"
+                retain=MQTT_RETAIN,
+                properties=self.properties
+            )
+            # MQTT_ERR_NO_CONN: связь пропала после проверки is_connected(), но paho уже
+            # поставил сообщение QoS 1 в свою очередь и отправит его после переподключения,
+            # поэтому оно в полёте, как и успешно отправленное
+            if result.rc == mqtt.MQTT_ERR_NO_CONN:
+                logging.warning(f"Connection lost while publishing ({describe(row)}), queued for resend by paho")
+            elif result.rc != mqtt.MQTT_ERR_SUCCESS:
+                logging.error(
+                    f"Failed to publish {PAYLOAD_FORMAT} message ({describe(row)}), "
+                    f"error code: {result.rc}"
+                )
+                return 1.0
+
+            self.inflight[result.mid] = (row, now)
+            self.last_id = row[0]
+            self.next_send = now + self.send_interval
+
+        # Окно заполнено: ждём подтверждений
+        return 1.0
+
+
+def encode_row(row):
+    """
+    Кодирует строку outbox (id, timestamp, value, min, max, count):
+    сводку окна — форматом сводки, одиночный замер — обычным показанием.
     """
-    Циклически публикует данные в MQTT:
-    - генерирует случайную температуру
+    row_id, timestamp, value, minimum, maximum, count = row
+    if count is None:
+        return encode_reading(value, timestamp)
+    return encode_window(value, timestamp, minimum, maximum, count)
+
+
+def describe(row):
+    """
+    Краткое описание строки outbox для логов.
+    """
+    row_id, timestamp, value, minimum, maximum, count = row
+    if count is None:
+        return f"value={value}, timestamp={timestamp}"
+    return f"mean={value}, min={minimum}, max={maximum}, count={count}, timestamp={timestamp}"
+
+
+def enqueue(publisher, timestamp_ms, value, minimum=None, maximum=None, count=None):
+    """
+    Кладёт показание (или сводку окна) в outbox и будит поток отправки.
+    """
+    outbox = publisher.outbox
+    dropped = outbox.dropped
+    outbox.append(timestamp_ms, value, minimum, maximum, count)
+    publisher.wake()
+
+    if outbox.dropped > dropped:
+        logging.warning(f"Outbox is full ({OUTBOX_MAX_SIZE}), dropped {outbox.dropped - dropped} oldest readings")
+    if not client.is_connected():
+        logging.warning(f"Broker unavailable, reading buffered (outbox {len(outbox)})")
+
+
+def publish_periodically(publisher):
+    """
+    Циклически снимает показания и кладёт их в outbox:
+    - генерирует температуру моделью VALUE_MODEL
     - добавляет timestamp (мс)
-    - отправляет JSON в указанный топик
+    - в режимах aggregate и deadband замеряет раз в SAMPLE_INTERVAL,
+      а в outbox попадают только сводки окон или значимые изменения
+    - отправку JSON (или двоичного payload) в топик выполняет OutboxPublisher,
+      поэтому показания, снятые без связи с брокером, не теряются
     """
-    while True:
-        # Генерация данных: температура от 10 до 40
-        value = random.randint(10, 40)
+    model = make_model(VALUE_MODEL, random.Random())
+
+    if REPORT_MODE == "aggregate":
+        reporter = WindowAggregator(int(PUBLISH_INTERVAL * 1000))
+    elif REPORT_MODE == "deadband":
+        reporter = Deadband(DEADBAND, int(HEARTBEAT_INTERVAL * 1000))
+    else:
+        reporter = None
+
+    interval = PUBLISH_INTERVAL if reporter is None else SAMPLE_INTERVAL
+    samples = published = 0
+
+    # Абсолютное расписание замеров: задержки не накапливаются
+    next_sample = time.monotonic()
 
+    while True:
         # Метка времени (в миллисекундах)
         timestamp_ms = int(time.time() * 1000)
 
-        # Формирование JSON-сообщения
-        mqtt_message = json.dumps({
-            "value": value,
-            "timestamp": timestamp_ms
-        })
+        # Округление: в сообщении достаточно сотых долей градуса
+        value = round(model.next(timestamp_ms / 1000), 2)
+        samples += 1
 
-        # Публикация в MQTT
-        try:
-            result = client.publish(
-                MQTT_TOPIC,       # Топик
-                mqtt_message,     # Сообщение
-                qos=1,            # Доставка "как минимум один раз"
-                retain=MQTT_RETAIN
-            )
+        if reporter is None:
+            enqueue(publisher, timestamp_ms, value)
+            published += 1
 
-            # Проверяем статус отправки
-            status = result.rc
-            if status == mqtt.MQTT_ERR_SUCCESS:
+        elif REPORT_MODE == "aggregate":
+            summary = reporter.add(value, timestamp_ms)
+            if summary is not None:
+                mean, window_end, minimum, maximum, count = summary
+                enqueue(publisher, window_end, round(mean, 2), minimum, maximum, count)
+                published += 1
                 logging.info(
-                    f"Published message '{mqtt_message}' "
-                    f"to topic '{MQTT_TOPIC}' on {MQTT_HOST}:{MQTT_PORT} "
-                    f"with retain={MQTT_RETAIN}"
+                    f"Window summary: mean={mean:.2f}, min={minimum}, max={maximum}, count={count} "
+                    f"(samples {samples}, messages {published})"
                 )
+
+        elif reporter.add(value, timestamp_ms):
+            enqueue(publisher, timestamp_ms, value)
+            published += 1
+            logging.info(f"Deadband: publishing {value} (samples {samples}, messages {published})")
+
+        # Пауза до следующего замера
+        next_sample += interval
+        delay = next_sample - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        else:
+            next_sample = time.monotonic()
+
+
+class LoadSensor:
+    """
+    Имитируемый сенсор генератора нагрузки: топик, модель значений,
+    MQTT-подключение и последняя метка времени (метки строго возрастают,
+    чтобы db_writer не принял разные показания за повторную доставку).
+    """
+
+    __slots__ = ("topic", "model", "client", "last_timestamp")
+
+    def __init__(self, topic, model, client):
+        self.topic = topic
+        self.model = model
+        self.client = client
+        self.last_timestamp = 0
+
+
+def make_load_client(index):
+    """
+    Создаёт и подключает MQTT-клиента генератора нагрузки.
+    """
+    load_client = mqtt.Client(
+        callback_api_version=CallbackAPIVersion.VERSION2,
+        client_id=f"load-{os.getpid()}-{index}",
+        protocol=mqtt.MQTTv5
+    )
+    load_client.on_connect = on_connect
+    load_client.on_disconnect = on_disconnect
+    load_client.max_queued_messages_set(LOAD_MAX_QUEUED)
+    load_client.connect(MQTT_HOST, MQTT_PORT, 60)
+    load_client.loop_start()
+    return load_client
+
+
+def run_load():
+    """
+    Генератор нагрузки: LOAD_SENSORS сенсоров публикуют в сумме LOAD_RATE
+    сообщений в секунду через LOAD_CLIENTS подключений.
+
+    Расписание абсолютное: сообщение номер n отправляется в момент
+    start + n / LOAD_RATE, поэтому задержки sleep() и публикации не накапливаются —
+    после опоздания отправляются все просроченные сообщения сразу.
+    Отставание больше LOAD_MAX_LAG не догоняется: такие слоты пропускаются и учитываются в отчёте.
+    """
+    rng = random.Random(LOAD_SEED or None)
+    clients = [make_load_client(i) for i in range(LOAD_CLIENTS)]
+    sensors = [
+        LoadSensor(
+            LOAD_TOPIC_TEMPLATE.format(index=i),
+            make_model(LOAD_MODELS[i % len(LOAD_MODELS)], rng, LOAD_DIURNAL_PERIOD),
+            clients[i % LOAD_CLIENTS]
+        )
+        for i in range(LOAD_SENSORS)
+    ]
+
+    # Ждём подключения всех клиентов
+    connect_deadline = time.monotonic() + 30
+    while not all(c.is_connected() for c in clients):
+        if time.monotonic() > connect_deadline:
+            logging.error("Load clients failed to connect within 30 seconds")
+            break
+        time.sleep(0.1)
+
+    # Остановка по SIGTERM (docker stop) и Ctrl+C с выводом итогов
+    stopping = []
+    signal.signal(signal.SIGTERM, lambda signum, frame: stopping.append(signum))
+    signal.signal(signal.SIGINT, lambda signum, frame: stopping.append(signum))
+
+    logging.info(
+        f"Load mode: {LOAD_SENSORS} sensors, {LOAD_RATE:.0f} msg/s, {LOAD_CLIENTS} clients, "
+        f"models {','.join(LOAD_MODELS)}, format {PAYLOAD_FORMAT}, qos {LOAD_QOS}"
+    )
+
+    properties = publish_properties()
+    interval = 1.0 / LOAD_RATE
+    started = time.monotonic()
+    wall_started = time.time()
+    deadline = started + LOAD_DURATION if LOAD_DURATION > 0 else None
+
+    # scheduled — число пройденных слотов расписания (отправленные + ошибки + пропущенные)
+    scheduled = sent = skipped = 0
+    errors = Counter()
+    max_lag = 0.0
+    index = 0
+    last_results = {}
+    report_at = started + LOAD_REPORT_INTERVAL
+    report_sent = 0
+
+    while not stopping:
+        now = time.monotonic()
+        if deadline is not None and now >= deadline:
+            break
+
+        next_slot = started + scheduled * interval
+        if next_slot > now:
+            time.sleep(min(next_slot - now, 0.1))
+            continue
+
+        lag = now - next_slot
+        if lag > max_lag:
+            max_lag = lag
+        if lag > LOAD_MAX_LAG:
+            missed = int(lag / interval)
+            scheduled += missed
+            skipped += missed
+            continue
+
+        # Все слоты, время которых уже наступило
+        due = int((now - started) / interval) + 1 - scheduled
+        for _ in range(due):
+            sensor = sensors[index]
+            index += 1
+            if index == LOAD_SENSORS:
+                index = 0
+
+            # Метка времени — плановый момент слота, а не фактический момент отправки
+            timestamp_ms = int((wall_started + scheduled * interval) * 1000)
+            if timestamp_ms <= sensor.last_timestamp:
+                timestamp_ms = sensor.last_timestamp + 1
+            sensor.last_timestamp = timestamp_ms
+
+            value = round(sensor.model.next(timestamp_ms / 1000), 2)
+            result = sensor.client.publish(
+                sensor.topic,
+                encode_reading(value, timestamp_ms),
+                qos=LOAD_QOS,
+                retain=MQTT_RETAIN,
+                properties=properties
+            )
+            if result.rc == mqtt.MQTT_ERR_SUCCESS:
+                sent += 1
+                last_results[sensor.client] = result
             else:
-                logging.error(
-                    f"Failed to publish message '{mqtt_message}', "
-                    f"error code: {status}"
-                )
-        except Exception as e:
-            logging.error(f"Exception during publish: {e}")
+                errors[result.rc] += 1
+            scheduled += 1
+
+        if now >= report_at:
+            logging.info(
+                f"Load: {(sent - report_sent) / LOAD_REPORT_INTERVAL:,.0f} msg/s, sent {sent}, "
+                f"errors {sum(errors.values())}, skipped {skipped}"
+            )
+            report_sent = sent
+            report_at += LOAD_REPORT_INTERVAL
+
+    elapsed = time.monotonic() - started
+
+    # Даём клиентам дослать очередь перед отключением
+    for result in last_results.values():
+        try:
+            result.wait_for_publish(timeout=5)
+        except (RuntimeError, ValueError):
+            pass
+    for load_client in clients:
+        load_client.disconnect()
+        load_client.loop_stop()
+
+    log_load_summary(elapsed, sent, errors, skipped, max_lag)
+
 
-        # Пауза между публикациями
-        time.sleep(PUBLISH_INTERVAL)
+def log_load_summary(elapsed, sent, errors, skipped, max_lag):
+    """
+    Итоги генератора нагрузки: фактическая скорость против целевой,
+    ошибки публикации по кодам, пропущенные слоты и максимальное отставание.
+    """
+    rate = sent / elapsed if elapsed > 0 else 0.0
+    logging.info(
+        f"Load summary: {sent} messages in {elapsed:.1f} s, "
+        f"achieved {rate:,.0f} msg/s of target {LOAD_RATE:,.0f} msg/s ({rate / LOAD_RATE:.1%})"
+    )
+    logging.info(f"Load summary: skipped {skipped} slots, max schedule lag {max_lag * 1000:.1f} ms")
+    if errors:
+        for rc, count in errors.most_common():
+            logging.error(f"Load summary: {count} publish errors: {mqtt.error_string(rc)} (rc={rc})")
+    else:
+        logging.info("Load summary: no publish errors")
 
 
 # -----------------------------------------
 # Создание MQTT-клиента
 # -----------------------------------------
-# Используем API версии 2 (рекомендуется paho-mqtt)
-client = mqtt.Client(callback_api_version=CallbackAPIVersion.VERSION2)
+# Используем API версии 2 (рекомендуется paho-mqtt) и MQTT 5:
+# content_type передаётся свойством публикации
+client = mqtt.Client(
+    callback_api_version=CallbackAPIVersion.VERSION2,
+    protocol=mqtt.MQTTv5
+)
 
 # Привязка callback-функций
 client.on_connect = on_connect
 client.on_disconnect = on_disconnect
 
+# Окно in-flight paho совпадает с окном OutboxPublisher
+client.max_inflight_messages_set(MAX_INFLIGHT)
+
 
 # -----------------------------------------
 # Точка входа
 # -----------------------------------------
 if __name__ == "__main__":
     # Задержка перед первым подключением (даёт брокеру время на запуск)
-    time.sleep(PUBLISH_INTERVAL)
+    time.sleep(STARTUP_DELAY)
+
+    if SENSOR_MODE == "load":
+        run_load()
+        raise SystemExit(0)
+
+    # Персистентная очередь показаний и фоновая отправка из неё
+    outbox = Outbox(OUTBOX_PATH, OUTBOX_MAX_SIZE)
+    if len(outbox):
+        logging.info(f"Outbox {OUTBOX_PATH} holds {len(outbox)} undelivered readings from previous run")
+
+    publisher = OutboxPublisher(client, outbox, MAX_INFLIGHT, OUTBOX_DRAIN_RATE)
+    client.on_connect = publisher.on_connect
+    client.on_publish = publisher.on_publish
 
-    try:
-        # Подключение к брокеру MQTT
-        client.connect(MQTT_HOST, MQTT_PORT, 60)
+    # Подключение в фоне: цикл paho переподключается сам,
+    # а показания копятся в outbox, пока брокер недоступен
+    client.connect_async(MQTT_HOST, MQTT_PORT, 60)
 
-        # Запуск фонового цикла обработки MQTT-событий
-        client.loop_start()
+    # Запуск фонового цикла обработки MQTT-событий
+    client.loop_start()
+    publisher.start()
 
-        # Бесконечная отправка данных
-        publish_periodically()
-    except Exception as e:
-        logging.error(f"Error connecting to MQTT broker: {e}")
-        client.loop_stop()
+    # Бесконечное формирование данных
+    publish_periodically(publisher)
@@ -0,0 +1,108 @@
+import math
+
+
+class Uniform:
+    """
+    Независимые случайные целые значения в [low, high]
+    (исходное поведение сенсора).
+    """
+
+    __slots__ = ("rng", "low", "high")
+
+    def __init__(self, rng, low=10, high=40):
+        self.rng = rng
+        self.low = low
+        self.high = high
+
+    def next(self, now):
+        return self.rng.randint(self.low, self.high)
+
+
+class RandomWalk:
+    """
+    Случайное блуждание: каждое следующее значение отличается от предыдущего
+    на нормально распределённый шаг и отражается от границ [low, high].
+    """
+
+    __slots__ = ("rng", "value", "step", "low", "high")
+
+    def __init__(self, rng, start=22.0, step=0.2, low=10.0, high=40.0):
+        self.rng = rng
+        self.value = start
+        self.step = step
+        self.low = low
+        self.high = high
+
+    def next(self, now):
+        value = self.value + self.rng.gauss(0.0, self.step)
+        if value > self.high:
+            value = 2 * self.high - value
+        elif value < self.low:
+            value = 2 * self.low - value
+        self.value = value
+        return value
+
+
+class Diurnal:
+    """
+    Суточный цикл: синусоида с периодом period секунд вокруг mean
+    с амплитудой amplitude, собственной фазой и гауссовым шумом.
+    """
+
+    __slots__ = ("rng", "mean", "amplitude", "period", "phase", "noise")
+
+    def __init__(self, rng, mean=22.0, amplitude=4.0, period=86400.0, noise=0.3):
+        self.rng = rng
+        self.mean = mean
+        self.amplitude = amplitude
+        self.period = period
+        # Случайная фаза: у разных сенсоров максимум приходится на разное время
+        self.phase = rng.uniform(0.0, 2 * math.pi)
+        self.noise = noise
+
+    def next(self, now):
+        angle = 2 * math.pi * now / self.period + self.phase
+        return self.mean + self.amplitude * math.sin(angle) + self.rng.gauss(0.0, self.noise)
+
+
+class Spikes:
+    """
+    Выбросы поверх базовой модели: с вероятностью probability к значению
+    добавляется скачок до magnitude градусов (вверх или вниз).
+    """
+
+    __slots__ = ("rng", "base", "probability", "magnitude")
+
+    def __init__(self, rng, base, probability=0.01, magnitude=15.0):
+        self.rng = rng
+        self.base = base
+        self.probability = probability
+        self.magnitude = magnitude
+
+    def next(self, now):
+        value = self.base.next(now)
+        if self.rng.random() < self.probability:
+            spike = self.magnitude * self.rng.uniform(0.5, 1.0)
+            value += spike if self.rng.random() < 0.8 else -spike
+        return value
+
+
+# Поддерживаемые модели значений
+MODELS = ("uniform", "walk", "diurnal", "spikes")
+
+
+def make_model(name, rng, period=86400.0):
+    """
+    Создаёт модель значений по имени:
+    uniform — независимые случайные целые, walk — случайное блуждание,
+    diurnal — суточный цикл, spikes — суточный цикл с редкими выбросами.
+    """
+    if name == "uniform":
+        return Uniform(rng)
+    if name == "walk":
+        return RandomWalk(rng, start=rng.uniform(18.0, 26.0))
+    if name == "diurnal":
+        return Diurnal(rng, period=period)
+    if name == "spikes":
+        return Spikes(rng, Diurnal(rng, period=period))
+    raise ValueError(f"Unknown value model '{name}', expected one of {', '.join(MODELS)}")
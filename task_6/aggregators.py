@@ -0,0 +1,457 @@
+from bisect import bisect_left, insort
+from collections import deque
+import heapq  # Для работы с кучами, используемыми для вычисления медианы
+import math
+import os
+
+# Векторная обработка пачек (опционально): без numpy update_many() обрабатывает значения по одному
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Размер окна точной скользящей медианы (число последних значений)
+MEDIAN_WINDOW_SIZE = int(os.getenv("MEDIAN_WINDOW_SIZE", "10000"))
+
+# Окно скользящей медианы по времени (в секундах); 0 — окно по количеству
+MEDIAN_WINDOW_SECONDS = float(os.getenv("MEDIAN_WINDOW_SECONDS", "0"))
+
+# Относительная точность скетча квантилей и максимальное число его корзин
+SKETCH_ACCURACY = float(os.getenv("SKETCH_ACCURACY", "0.01"))
+SKETCH_MAX_BINS = int(os.getenv("SKETCH_MAX_BINS", "2048"))
+
+
+class Aggregator:
+    """
+    Базовый класс статистики по потоку чисел.
+    Каждая статистика получает уже преобразованное значение
+    и умеет вернуть текущий результат и строку для вывода.
+    """
+
+    # Имя статистики (используется в настройке AGGREGATORS и в выводе)
+    name = ""
+
+    def update(self, value, timestamp=None):
+        """
+        Учитывает очередное значение; timestamp — время сообщения в миллисекундах
+        (нужно статистикам с окном по времени).
+        """
+        raise NotImplementedError
+
+    def update_many(self, values, timestamps):
+        """
+        Учитывает пачку значений (массивы numpy одинаковой длины).
+        Статистики, которые умеют считать векторно, переопределяют этот метод.
+        """
+        for value, timestamp in zip(values.tolist(), timestamps.tolist()):
+            self.update(value, timestamp)
+
+    def merge(self, other):
+        """
+        Добавляет к статистике результат такой же статистики другого потребителя.
+        """
+        raise NotImplementedError
+
+    def result(self):
+        """
+        Текущий результат в виде словаря {показатель: значение}.
+        """
+        raise NotImplementedError
+
+    def to_state(self):
+        """
+        Состояние статистики для снимка (словарь, сериализуемый в JSON).
+        """
+        raise NotImplementedError
+
+    def load_state(self, state):
+        """
+        Восстанавливает состояние из снимка to_state().
+        """
+        raise NotImplementedError
+
+    def report(self):
+        """
+        Строка для вывода текущего результата.
+        """
+        return " | ".join(
+            f"{key.capitalize()}: {'--' if value is None else f'{value:.4f}'}"
+            for key, value in self.result().items()
+        )
+
+
+class Average(Aggregator):
+    """
+    Среднее значение: сумма и количество сообщений.
+    """
+
+    name = "average"
+
+    def __init__(self):
+        self.total = 0.0
+        self.count = 0
+
+    def update(self, value, timestamp=None):
+        self.total += value
+        self.count += 1
+
+    def update_many(self, values, timestamps):
+        self.total += float(values.sum())
+        self.count += len(values)
+
+    def merge(self, other):
+        self.total += other.total
+        self.count += other.count
+
+    def result(self):
+        return {"average": self.total / self.count if self.count else None}
+
+    def to_state(self):
+        return {"total": self.total, "count": self.count}
+
+    def load_state(self, state):
+        self.total = state["total"]
+        self.count = state["count"]
+
+
+class MinMax(Aggregator):
+    """
+    Минимальное и максимальное значения.
+    """
+
+    name = "min_max"
+
+    def __init__(self):
+        self.min_value = None
+        self.max_value = None
+
+    def update(self, value, timestamp=None):
+        if self.min_value is None or value < self.min_value:
+            self.min_value = value
+        if self.max_value is None or value > self.max_value:
+            self.max_value = value
+
+    def update_many(self, values, timestamps):
+        if len(values):
+            self.update(float(values.min()))
+            self.update(float(values.max()))
+
+    def merge(self, other):
+        for value in (other.min_value, other.max_value):
+            if value is not None:
+                self.update(value)
+
+    def result(self):
+        return {"min": self.min_value, "max": self.max_value}
+
+    def to_state(self):
+        return {"min": self.min_value, "max": self.max_value}
+
+    def load_state(self, state):
+        self.min_value = state["min"]
+        self.max_value = state["max"]
+
+
+class MedianFinder:
+    """
+    Класс для нахождения медианы.
+    Использует две кучи: small для больших элементов и large для меньших.
+    """
+    def __init__(self):
+        # small - малая куча для хранения больших половин чисел (с инверсией знака)
+        self.small = []
+        # large - большая куча для хранения меньших половин чисел
+        self.large = []
+
+    def add_num(self, num):
+        """
+        Добавление числа в структуры данных для поддержания медианы.
+        Число добавляется в кучу small (с инверсией), чтобы на вершине small всегда было максимальное число.
+        Если количество элементов в small больше, чем в large, переносим элемент из small в large.
+        Если в large больше элементов, переносим из него элемент обратно в small.
+        """
+        # Добавляем число в small (с инверсией знака)
+        heapq.heappush(self.small, -num)
+
+        # Переносим максимальный элемент из small в large
+        heapq.heappush(self.large, -heapq.heappop(self.small))
+
+        # Если в large больше элементов, переносим из large обратно в small
+        if len(self.large) > len(self.small):
+            heapq.heappush(self.small, -heapq.heappop(self.large))
+
+    def find_median(self):
+        """
+        Находим медиану:
+        - Если в small больше элементов, медианой является максимальное число из small.
+        - Если куча small и large равны по размеру, медианой является среднее арифметическое их корней.
+        """
+        if len(self.small) > len(self.large):
+            # Медиана для нечетного числа элементов
+            return float(-self.small[0])
+        else:
+            # Медиана для четного числа элементов
+            return (-self.small[0] + self.large[0]) / 2.0
+
+
+class Median(Aggregator):
+    """
+    Точная медиана по всем значениям (MedianFinder).
+    Хранит все значения потока: память растёт вместе с его длиной.
+    """
+
+    name = "median"
+
+    def __init__(self):
+        self.finder = MedianFinder()
+
+    def update(self, value, timestamp=None):
+        self.finder.add_num(value)
+
+    def merge(self, other):
+        for value in other.finder.small:
+            self.finder.add_num(-value)
+        for value in other.finder.large:
+            self.finder.add_num(value)
+
+    def result(self):
+        return {"median": self.finder.find_median() if self.finder.small else None}
+
+    def to_state(self):
+        # Кучи — обычные списки и сохраняются как есть (размер снимка растёт с длиной потока)
+        return {"small": self.finder.small, "large": self.finder.large}
+
+    def load_state(self, state):
+        self.finder.small = list(state["small"])
+        self.finder.large = list(state["large"])
+
+
+class SlidingMedian(Aggregator):
+    """
+    Точная медиана по скользящему окну: последние size значений
+    или значения за последние seconds секунд (по времени сообщений).
+
+    Значения окна хранятся в отсортированном списке (вставка и удаление
+    устаревшего значения — бинарный поиск), порядок поступления — в очереди.
+    Память ограничена размером окна.
+    """
+
+    name = "window_median"
+
+    def __init__(self, size=MEDIAN_WINDOW_SIZE, seconds=MEDIAN_WINDOW_SECONDS):
+        self.size = size
+        self.window_ms = seconds * 1000 if seconds > 0 else None
+        # Значения окна по возрастанию
+        self.values = []
+        # (timestamp, value) в порядке поступления
+        self.items = deque()
+
+    def update(self, value, timestamp=None):
+        insort(self.values, value)
+        self.items.append((timestamp or 0, value))
+        self.expire(timestamp)
+
+    def expire(self, now):
+        """
+        Удаляет из окна значения, вышедшие за его границу.
+        """
+        items = self.items
+        if self.window_ms is None:
+            while len(items) > self.size:
+                self.remove(items.popleft()[1])
+        elif now is not None:
+            while items and items[0][0] <= now - self.window_ms:
+                self.remove(items.popleft()[1])
+
+    def remove(self, value):
+        del self.values[bisect_left(self.values, value)]
+
+    def update_many(self, values, timestamps):
+        self.items.extend(zip(timestamps.tolist(), values.tolist()))
+        if self.window_ms is None:
+            # Из окна уходит не больше size последних значений
+            while len(self.items) > self.size:
+                self.items.popleft()
+        elif len(timestamps):
+            now = int(timestamps[-1])
+            while self.items and self.items[0][0] <= now - self.window_ms:
+                self.items.popleft()
+
+        # Окно пересобирается сортировкой (timsort использует уже отсортированные участки)
+        self.values = sorted(value for _, value in self.items)
+
+    def merge(self, other):
+        """
+        Объединяет окна двух потребителей (например, разных разделов потока):
+        результат — медиана по значениям обоих окон.
+        """
+        self.values = list(heapq.merge(self.values, other.values))
+        self.items = deque(heapq.merge(self.items, other.items, key=lambda item: item[0]))
+        if self.window_ms is None:
+            self.size += other.size
+        elif self.items:
+            self.expire(self.items[-1][0])
+
+    def result(self):
+        values = self.values
+        n = len(values)
+        if n == 0:
+            return {"window_median": None}
+        middle = n // 2
+        if n % 2:
+            return {"window_median": float(values[middle])}
+        return {"window_median": (values[middle - 1] + values[middle]) / 2.0}
+
+    def to_state(self):
+        # Отсортированный список восстанавливается из содержимого окна
+        return {"items": list(self.items)}
+
+    def load_state(self, state):
+        self.items = deque((timestamp, value) for timestamp, value in state["items"])
+        self.values = sorted(value for _, value in self.items)
+        # Параметры окна могли измениться с момента снимка
+        self.expire(self.items[-1][0] if self.items else None)
+
+
+class QuantileSketch(Aggregator):
+    """
+    Приближённые квантили p50/p95/p99 за постоянную память (по схеме DDSketch).
+
+    Положительные и отрицательные значения раскладываются по логарифмическим
+    корзинам с основанием gamma = (1 + accuracy) / (1 - accuracy), нули считаются отдельно.
+    Оценка квантиля отличается от точного значения не больше чем на
+    accuracy * |значение| (по умолчанию 1%), пока число корзин не превышает max_bins;
+    при превышении сливаются корзины самых малых по модулю значений, и граница
+    ошибки перестаёт действовать только для них.
+
+    Скетчи с одинаковой точностью объединяются сложением корзин, без потери точности.
+    """
+
+    name = "quantiles"
+
+    # Значения меньше по модулю считаются нулём
+    MIN_VALUE = 1e-9
+
+    QUANTILES = (("p50", 0.5), ("p95", 0.95), ("p99", 0.99))
+
+    def __init__(self, accuracy=SKETCH_ACCURACY, max_bins=SKETCH_MAX_BINS):
+        self.accuracy = accuracy
+        self.max_bins = max_bins
+        self.gamma = (1 + accuracy) / (1 - accuracy)
+        self.log_gamma = math.log(self.gamma)
+        # индекс корзины -> количество (отдельно для положительных и отрицательных значений)
+        self.positive = {}
+        self.negative = {}
+        self.zero_count = 0
+        self.count = 0
+
+    def update(self, value, timestamp=None):
+        self.count += 1
+        if value > self.MIN_VALUE:
+            self.add(self.positive, math.ceil(math.log(value) / self.log_gamma), 1)
+        elif value < -self.MIN_VALUE:
+            self.add(self.negative, math.ceil(math.log(-value) / self.log_gamma), 1)
+        else:
+            self.zero_count += 1
+
+    def update_many(self, values, timestamps):
+        self.count += len(values)
+        for bins, part in ((self.positive, values[values > self.MIN_VALUE]),
+                           (self.negative, -values[values < -self.MIN_VALUE])):
+            if len(part):
+                indexes, counts = np.unique(np.ceil(np.log(part) / self.log_gamma), return_counts=True)
+                for index, count in zip(indexes.astype(np.int64).tolist(), counts.tolist()):
+                    self.add(bins, index, count)
+        self.zero_count += int(np.count_nonzero(np.abs(values) <= self.MIN_VALUE))
+
+    def add(self, bins, index, count):
+        bins[index] = bins.get(index, 0) + count
+        if len(bins) > self.max_bins:
+            self.collapse(bins)
+
+    def collapse(self, bins):
+        """
+        Сливает корзины самых малых по модулю значений, чтобы корзин осталось max_bins.
+        """
+        indexes = sorted(bins)
+        excess = len(indexes) - self.max_bins + 1
+        target = indexes[excess]
+        for index in indexes[:excess]:
+            bins[target] += bins.pop(index)
+
+    def merge(self, other):
+        if other.gamma != self.gamma:
+            raise ValueError("Cannot merge quantile sketches with different accuracy")
+        for bins, other_bins in ((self.positive, other.positive), (self.negative, other.negative)):
+            for index, count in other_bins.items():
+                self.add(bins, index, count)
+        self.zero_count += other.zero_count
+        self.count += other.count
+
+    def value_at(self, index):
+        # Середина корзины (gamma^(i-1), gamma^i] с относительной ошибкой не больше accuracy
+        return 2 * self.gamma ** index / (self.gamma + 1)
+
+    def quantile(self, q):
+        """
+        Оценка квантиля q (0..1) или None, если значений нет.
+        """
+        if self.count == 0:
+            return None
+
+        rank = q * (self.count - 1)
+        seen = 0
+
+        # Отрицательные значения: от больших по модулю к малым
+        for index in sorted(self.negative, reverse=True):
+            seen += self.negative[index]
+            if seen > rank:
+                return -self.value_at(index)
+
+        seen += self.zero_count
+        if seen > rank:
+            return 0.0
+
+        for index in sorted(self.positive):
+            seen += self.positive[index]
+            if seen > rank:
+                return self.value_at(index)
+
+        return self.value_at(max(self.positive))
+
+    def result(self):
+        return {key: self.quantile(q) for key, q in self.QUANTILES}
+
+    def to_state(self):
+        return {
+            "accuracy": self.accuracy,
+            "positive": self.positive,
+            "negative": self.negative,
+            "zero_count": self.zero_count,
+            "count": self.count,
+        }
+
+    def load_state(self, state):
+        if state["accuracy"] != self.accuracy:
+            raise ValueError(f"Snapshot sketch accuracy {state['accuracy']} differs from configured {self.accuracy}")
+        # Ключи JSON-объекта — строки
+        self.positive = {int(index): count for index, count in state["positive"].items()}
+        self.negative = {int(index): count for index, count in state["negative"].items()}
+        self.zero_count = state["zero_count"]
+        self.count = state["count"]
+
+
+# Доступные статистики по имени; новая статистика добавляется сюда
+AGGREGATORS = {cls.name: cls for cls in (Average, MinMax, Median, SlidingMedian, QuantileSketch)}
+
+
+def create_aggregators(names):
+    """
+    Создаёт статистики по списку имён (например, ["average", "min_max", "median"]).
+    """
+    aggregators = []
+    for name in names:
+        if name not in AGGREGATORS:
+            raise ValueError(f"Unknown aggregator '{name}', expected one of {', '.join(AGGREGATORS)}")
+        aggregators.append(AGGREGATORS[name]())
+    return aggregators
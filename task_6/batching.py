@@ -0,0 +1,39 @@
+import numpy as np
+
+
+class Batch:
+    """
+    Пачка значений в заранее выделенных массивах numpy.
+
+    Сообщения складываются в пачку по одному, а статистики обновляются
+    векторно (update_many) сразу по всей пачке — при заполнении или по таймеру.
+    """
+
+    def __init__(self, size):
+        self.values = np.empty(size, dtype=np.float64)
+        self.timestamps = np.empty(size, dtype=np.int64)
+        self.size = size
+        self.count = 0
+
+    def add(self, value, timestamp):
+        """
+        Добавляет значение; возвращает True, если пачка заполнена.
+        """
+        self.values[self.count] = value
+        self.timestamps[self.count] = timestamp
+        self.count += 1
+        return self.count == self.size
+
+    def flush(self, aggregators):
+        """
+        Передает накопленные значения статистикам и очищает пачку.
+        Возвращает число обработанных значений.
+        """
+        count = self.count
+        if count:
+            values = self.values[:count]
+            timestamps = self.timestamps[:count]
+            for aggregator in aggregators:
+                aggregator.update_many(values, timestamps)
+            self.count = 0
+        return count
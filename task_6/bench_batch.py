@@ -0,0 +1,69 @@
+"""
+Бенчмарк обработки сообщений потока в client_stats.py.
+
+Сравнивает на одном наборе сообщений (bytes, как их отдает rstream):
+- по одному сообщению с печатью строки на каждое (исходный режим);
+- по одному сообщению с выводом по интервалу (REPORT_INTERVAL);
+- пачками в массивах numpy с векторным обновлением статистик (BATCH_SIZE).
+
+Печать идет в /dev/null, поэтому стоимость вывода в реальный терминал или лог контейнера
+здесь занижена.
+
+Запуск: python bench_batch.py [число сообщений] [размер пачки]
+"""
+import os
+import random
+import sys
+import time
+
+from aggregators import create_aggregators
+from batching import Batch
+
+MESSAGES = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+BATCH_SIZE = int(sys.argv[2]) if len(sys.argv) > 2 else 1024
+
+# Те же статистики, что у client_stats по умолчанию
+AGGREGATORS = os.getenv("AGGREGATORS", "min_max,average,window_median,quantiles").split(",")
+
+
+def per_message(messages, output):
+    aggregators = create_aggregators(AGGREGATORS)
+    for timestamp, msg in enumerate(messages):
+        value = float(msg)
+        for aggregator in aggregators:
+            aggregator.update(value, timestamp)
+        if output is not None:
+            print(f"Received value: {value} | " + " | ".join(a.report() for a in aggregators), file=output)
+    return aggregators
+
+
+def batched(messages, output):
+    aggregators = create_aggregators(AGGREGATORS)
+    batch = Batch(BATCH_SIZE)
+    for timestamp, msg in enumerate(messages):
+        if batch.add(float(msg), timestamp):
+            batch.flush(aggregators)
+    batch.flush(aggregators)
+    return aggregators
+
+
+def run(name, func, messages, output=None):
+    started = time.perf_counter()
+    aggregators = func(messages, output)
+    elapsed = time.perf_counter() - started
+    print(f"{name:<34} {len(messages) / elapsed:>12,.0f} msg/s")
+    return aggregators
+
+
+if __name__ == "__main__":
+    messages = [str(random.randint(0, 100)).encode() for _ in range(MESSAGES)]
+    print(f"Messages: {MESSAGES}, aggregators: {','.join(AGGREGATORS)}, batch size: {BATCH_SIZE}")
+
+    with open(os.devnull, "w") as devnull:
+        run("per message, print each", per_message, messages, devnull)
+    expected = run("per message, interval report", per_message, messages)
+    actual = run("numpy batches", batched, messages)
+
+    # Пачки дают те же результаты, что и обработка по одному
+    same = all(a.result() == b.result() for a, b in zip(expected, actual))
+    print(f"Results match: {same}")
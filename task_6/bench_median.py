@@ -0,0 +1,59 @@
+"""
+Бенчмарк медианы по потоку чисел.
+
+Сравнивает:
+- MedianFinder (две кучи, хранит все значения);
+- SlidingMedian (точная медиана по окну из MEDIAN_WINDOW_SIZE последних значений);
+- QuantileSketch (приближённые p50/p95/p99 за постоянную память).
+
+Для каждого варианта выводит скорость (значений в секунду), пик памяти (tracemalloc)
+и для скетча — относительную ошибку квантилей по сравнению с точными значениями.
+
+Запуск: python bench_median.py [число значений]
+"""
+import random
+import sys
+import time
+import tracemalloc
+
+from aggregators import Median, QuantileSketch, SlidingMedian
+
+VALUES = int(sys.argv[1]) if len(sys.argv) > 1 else 500_000
+
+
+def run(name, aggregator, values):
+    tracemalloc.start()
+    started = time.perf_counter()
+    for value in values:
+        aggregator.update(value)
+    result = aggregator.result()
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(f"{name:<28} {len(values) / elapsed:>12,.0f} values/s {peak / 1024 / 1024:>9.2f} MiB  {result}")
+    return result
+
+
+if __name__ == "__main__":
+    # Значения как у генератора (целые 0..100) и непрерывное распределение
+    datasets = {
+        "randint(0, 100)": [float(random.randint(0, 100)) for _ in range(VALUES)],
+        "gauss(50, 20)": [random.gauss(50, 20) for _ in range(VALUES)],
+    }
+
+    for title, values in datasets.items():
+        print(f"\n{title}, {VALUES} values")
+        run("MedianFinder (all values)", Median(), values)
+        run("SlidingMedian (window)", SlidingMedian(), values)
+        sketch = QuantileSketch()
+        estimates = run("QuantileSketch", sketch, values)
+
+        # Точность скетча относительно точных квантилей по всем значениям
+        ordered = sorted(values)
+        errors = []
+        for key, q in QuantileSketch.QUANTILES:
+            exact = ordered[int(q * (len(ordered) - 1))]
+            error = abs(estimates[key] - exact) / abs(exact) if exact else abs(estimates[key])
+            errors.append(f"{key} {error:.3%}")
+        print(f"{'sketch relative error':<28} {', '.join(errors)} (bound {sketch.accuracy:.0%})")
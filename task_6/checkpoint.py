@@ -0,0 +1,63 @@
+import json
+import os
+
+
+def snapshot_state(stream, offset, aggregators):
+    """
+    Снимок в виде словаря: смещение последнего учтенного сообщения
+    и состояние всех статистик (to_state()).
+    """
+    return {
+        "stream": stream,
+        "offset": offset,
+        "aggregators": {aggregator.name: aggregator.to_state() for aggregator in aggregators},
+    }
+
+
+def restore_state(snapshot, aggregators):
+    """
+    Загружает в статистики состояние из снимка snapshot_state() и возвращает его смещение.
+    Статистики, которых нет в снимке, начинают с пустого состояния.
+    """
+    states = snapshot["aggregators"]
+    for aggregator in aggregators:
+        state = states.get(aggregator.name)
+        if state is None:
+            print(f"Snapshot has no state for '{aggregator.name}', it starts empty")
+        else:
+            aggregator.load_state(state)
+
+    return snapshot["offset"]
+
+
+def save_snapshot(path, stream, offset, aggregators):
+    """
+    Атомарно записывает снимок: смещение последнего учтенного сообщения
+    и состояние всех статистик (временный файл + os.replace).
+    """
+    snapshot = snapshot_state(stream, offset, aggregators)
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(snapshot, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def load_snapshot(path, stream, aggregators):
+    """
+    Восстанавливает состояние статистик из снимка.
+    Возвращает смещение последнего учтенного сообщения или None, если снимка нет.
+    Статистики, которых нет в снимке, начинают с пустого состояния.
+    """
+    try:
+        with open(path) as f:
+            snapshot = json.load(f)
+    except FileNotFoundError:
+        return None
+
+    if snapshot["stream"] != stream:
+        raise ValueError(f"Snapshot {path} belongs to stream '{snapshot['stream']}', not '{stream}'")
+
+    return restore_state(snapshot, aggregators)
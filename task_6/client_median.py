@@ -1,5 +1,4 @@
 import asyncio
-import heapq  # Для работы с кучами, используемыми для вычисления медианы
 
 from rstream import (
     AMQPMessage,  # Импорт AMQP-сообщений для обработки входящих сообщений
@@ -9,52 +8,12 @@ from rstream import (
     OffsetType,  # Типы смещений для потребителя
 )
 
+from aggregators import MedianFinder  # Медиана на двух кучах (общая со статистиками client_stats)
+
 # Имя потока, с которым будем работать
 STREAM_NAME = "test_stream"
 
 
-class MedianFinder:
-    """
-    Класс для нахождения медианы.
-    Использует две кучи: small для больших элементов и large для меньших.
-    """
-    def __init__(self):
-        # small - малая куча для хранения больших половин чисел (с инверсией знака)
-        self.small = []  
-        # large - большая куча для хранения меньших половин чисел
-        self.large = []
-
-    def add_num(self, num):
-        """
-        Добавление числа в структуры данных для поддержания медианы.
-        Число добавляется в кучу small (с инверсией), чтобы на вершине small всегда было максимальное число.
-        Если количество элементов в small больше, чем в large, переносим элемент из small в large.
-        Если в large больше элементов, переносим из него элемент обратно в small.
-        """
-        # Добавляем число в small (с инверсией знака)
-        heapq.heappush(self.small, -num)
-
-        # Переносим максимальный элемент из small в large
-        heapq.heappush(self.large, -heapq.heappop(self.small))
-
-        # Если в large больше элементов, переносим из large обратно в small
-        if len(self.large) > len(self.small):
-            heapq.heappush(self.small, -heapq.heappop(self.large))
-
-    def find_median(self):
-        """
-        Находим медиану:
-        - Если в small больше элементов, медианой является максимальное число из small.
-        - Если куча small и large равны по размеру, медианой является среднее арифметическое их корней.
-        """
-        if len(self.small) > len(self.large):
-            # Медиана для нечетного числа элементов
-            return float(-self.small[0])
-        else:
-            # Медиана для четного числа элементов
-            return (-self.small[0] + self.large[0]) / 2.0
-
-
 # Создаем объект для нахождения медианы
 median_finder = MedianFinder()
 
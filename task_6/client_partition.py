@@ -0,0 +1,267 @@
+import asyncio
+import json
+import os
+import signal
+
+from rstream import (
+    AMQPMessage,  # Импорт AMQP-сообщений для обработки входящих сообщений
+    Consumer,     # Потребитель раздела (из контекста событий суперпотока)
+    EventContext,  # Контекст смены активного потребителя раздела
+    MessageContext,  # Контекст сообщения для обработки
+    OffsetNotFound,  # Сохраненного смещения для подписчика нет
+    OffsetSpecification,  # Смещение, с которого продолжает активный потребитель
+    OffsetType,  # Типы смещений для потребителя
+    Producer,    # Публикация частичных результатов
+    SuperStreamConsumer,  # Подписка на все разделы суперпотока
+    SuperStreamCreationOption,  # Число разделов при создании суперпотока
+    amqp_decoder,  # Разбор AMQP-сообщений (ключ маршрутизации в application_properties)
+)
+
+from aggregators import create_aggregators
+from checkpoint import load_snapshot, save_snapshot, snapshot_state
+
+# Имя суперпотока, разделы которого обрабатываются
+SUPER_STREAM = os.getenv("SUPER_STREAM", "test_super_stream")
+
+# Число разделов суперпотока (используется, если суперпоток еще не создан генератором)
+SUPER_STREAM_PARTITIONS = int(os.getenv("SUPER_STREAM_PARTITIONS", "3"))
+
+# Статистики через запятую; для объединения координатором подходят статистики с компактным состоянием
+AGGREGATORS = os.getenv("AGGREGATORS", "min_max,average,quantiles").split(",")
+
+# Имя группы потребителей: в каждом разделе активен ровно один потребитель группы
+# (single active consumer), под этим же именем брокер хранит смещения разделов
+CONSUMER_GROUP = os.getenv("CONSUMER_GROUP", "partition-stats")
+
+# Поток, в который публикуются частичные результаты разделов для координатора
+PARTIALS_STREAM = os.getenv("PARTIALS_STREAM", "test_super_stream-partials")
+
+# Интервал публикации частичных результатов (в секундах)
+PARTIAL_INTERVAL = float(os.getenv("PARTIAL_INTERVAL", "5"))
+
+# Каталог снимков разделов; общий для всех потребителей группы,
+# чтобы раздел продолжил с того же состояния после перехода к другому потребителю
+SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR", ".")
+
+# Интервал сохранения смещений и снимков (в секундах)
+CHECKPOINT_INTERVAL = float(os.getenv("CHECKPOINT_INTERVAL", "10"))
+
+# Имя для вывода (несколько экземпляров пишут в общий лог docker-compose)
+CONSUMER_NAME = os.getenv("HOSTNAME", "client-partition")
+
+
+class PartitionState:
+    """
+    Статистики и смещения одного раздела, в котором этот потребитель активен.
+    """
+
+    __slots__ = ("consumer", "aggregators", "last_offset", "checkpointed_offset")
+
+    def __init__(self, consumer: Consumer):
+        self.consumer = consumer
+        self.aggregators = create_aggregators(name.strip() for name in AGGREGATORS if name.strip())
+        self.last_offset = None
+        self.checkpointed_offset = None
+
+
+# Разделы, в которых этот потребитель сейчас активен
+partitions: dict[str, PartitionState] = {}
+
+
+def snapshot_path(partition):
+    return os.path.join(SNAPSHOT_DIR, f"{CONSUMER_GROUP}.{partition}.json")
+
+
+async def on_message(msg: AMQPMessage, message_context: MessageContext):
+    """
+    Обработчик сообщений раздела:
+    - Преобразует тело сообщения в число.
+    - Передает число статистикам раздела.
+    """
+    state = partitions.get(message_context.stream)
+    if state is None:
+        # Раздел уже передан другому потребителю
+        return
+
+    try:
+        # Преобразование тела сообщения в число
+        value = float(msg.body)
+    except (TypeError, ValueError):
+        print(f"Invalid value received in {message_context.stream}: {msg.body}")
+        state.last_offset = message_context.offset
+        return
+
+    for aggregator in state.aggregators:
+        aggregator.update(value, message_context.timestamp)
+    state.last_offset = message_context.offset
+
+
+async def checkpoint(partition, state: PartitionState):
+    """
+    Сохраняет снимок статистик раздела, затем смещение на брокере
+    (смещение на брокере никогда не опережает снимок).
+    """
+    offset = state.last_offset
+    if offset is None or offset == state.checkpointed_offset:
+        return
+
+    save_snapshot(snapshot_path(partition), partition, offset, state.aggregators)
+    await state.consumer.store_offset(partition, CONSUMER_GROUP, offset)
+    state.checkpointed_offset = offset
+
+
+async def checkpoint_periodically():
+    """
+    Раз в CHECKPOINT_INTERVAL секунд сохраняет снимки и смещения активных разделов.
+    """
+    while True:
+        await asyncio.sleep(CHECKPOINT_INTERVAL)
+        for partition, state in list(partitions.items()):
+            try:
+                await checkpoint(partition, state)
+            except Exception as e:
+                print(f"Checkpoint of {partition} failed: {e}")
+
+
+async def publish_partials(producer: Producer):
+    """
+    Публикует состояние статистик каждого активного раздела.
+    Состояние накопленное (а не приращение), поэтому координатору достаточно
+    последнего сообщения по каждому разделу, а повторы не искажают результат.
+    """
+    for partition, state in list(partitions.items()):
+        if state.last_offset is None:
+            continue
+        partial = snapshot_state(partition, state.last_offset, state.aggregators)
+        await producer.send(PARTIALS_STREAM, json.dumps(partial).encode())
+
+
+async def publish_partials_periodically(producer: Producer):
+    """
+    Раз в PARTIAL_INTERVAL секунд публикует частичные результаты разделов.
+    """
+    while True:
+        await asyncio.sleep(PARTIAL_INTERVAL)
+        try:
+            await publish_partials(producer)
+        except Exception as e:
+            print(f"Publishing partial results failed: {e}")
+
+
+async def on_consumer_update(is_active: bool, event_context: EventContext) -> OffsetSpecification:
+    """
+    Вызывается брокером, когда этот потребитель становится активным в разделе или перестает им быть.
+    - Активация: статистики раздела восстанавливаются из снимка, чтение продолжается
+      со следующего после снимка смещения (без снимка — с начала раздела).
+    - Деактивация: снимок и смещение раздела сохраняются до ответа брокеру,
+      поэтому новый активный потребитель продолжит с того же места.
+    """
+    partition = event_context.stream
+
+    if not is_active:
+        state = partitions.pop(partition, None)
+        if state is not None:
+            try:
+                await checkpoint(partition, state)
+            except Exception as e:
+                print(f"Checkpoint of {partition} failed: {e}")
+            print(f"[{CONSUMER_NAME}] Partition {partition} handed over at offset {state.last_offset}")
+        # Для неактивного потребителя смещение не используется, но ответ брокеру обязателен
+        return OffsetSpecification(OffsetType.NEXT, 0)
+
+    state = PartitionState(event_context.consumer)
+    snapshot_offset = load_snapshot(snapshot_path(partition), partition, state.aggregators)
+
+    try:
+        stored_offset = await state.consumer.query_offset(partition, CONSUMER_GROUP)
+    except OffsetNotFound:
+        stored_offset = None
+
+    partitions[partition] = state
+
+    if snapshot_offset is not None:
+        if stored_offset is not None and stored_offset != snapshot_offset:
+            print(f"Stored offset {stored_offset} of {partition} differs from snapshot offset {snapshot_offset}, using snapshot")
+        print(f"[{CONSUMER_NAME}] Partition {partition} is active, resuming after offset {snapshot_offset}")
+        state.last_offset = state.checkpointed_offset = snapshot_offset
+        return OffsetSpecification(OffsetType.OFFSET, snapshot_offset + 1)
+
+    print(f"[{CONSUMER_NAME}] Partition {partition} is active, reading from the beginning")
+    return OffsetSpecification(OffsetType.FIRST, 0)
+
+
+async def main():
+    """
+    Основная асинхронная функция, которая:
+    - Подписывается на все разделы суперпотока в группе CONSUMER_GROUP.
+      Брокер распределяет разделы между запущенными экземплярами (по одному активному на раздел),
+      поэтому обработку можно масштабировать числом процессов до числа разделов.
+    - Считает статистики отдельно по каждому активному разделу.
+    - Периодически публикует частичные результаты в PARTIALS_STREAM для координатора
+      и сохраняет снимки и смещения разделов.
+    """
+
+    # Поток частичных результатов
+    producer = Producer(
+        host="rabbitmq",
+        port=5552,
+        username="guest",
+        password="guest",
+    )
+    await producer.start()
+    await producer.create_stream(PARTIALS_STREAM, exists_ok=True)
+
+    consumer = SuperStreamConsumer(
+        host="rabbitmq",
+        port=5552,
+        username="guest",
+        password="guest",
+        super_stream=SUPER_STREAM,
+        # Суперпоток создается, если генератор еще не запущен
+        super_stream_creation_option=SuperStreamCreationOption(n_partitions=SUPER_STREAM_PARTITIONS),
+        connection_name=CONSUMER_NAME,
+    )
+    await consumer.start()
+
+    await consumer.subscribe(
+        callback=on_message,
+        decoder=amqp_decoder,
+        # Смещение раздела задается в on_consumer_update при активации
+        offset_specification=OffsetSpecification(OffsetType.FIRST, None),
+        subscriber_name=CONSUMER_GROUP,
+        properties={
+            "single-active-consumer": "true",
+            "name": CONSUMER_GROUP,
+            "super-stream": SUPER_STREAM,
+        },
+        consumer_update_listener=on_consumer_update,
+    )
+
+    print(f"[{CONSUMER_NAME}] Joined group '{CONSUMER_GROUP}' on super stream '{SUPER_STREAM}' "
+          f"with aggregators: {', '.join(AGGREGATORS)}. Waiting for partitions...")
+
+    tasks = [
+        asyncio.create_task(checkpoint_periodically()),
+        asyncio.create_task(publish_partials_periodically(producer)),
+    ]
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, consumer.stop)
+
+    await consumer.run()
+
+    # Перед выходом сохраняем разделы и публикуем последние частичные результаты
+    for task in tasks:
+        task.cancel()
+    for partition, state in list(partitions.items()):
+        await checkpoint(partition, state)
+    await publish_partials(producer)
+    await consumer.close()
+    await producer.close()
+
+
+if __name__ == "__main__":
+    """
+    Точка входа в программу.
+    Использует asyncio для запуска основной асинхронной функции.
+    """
+    with asyncio.Runner() as runner:
+        runner.run(main())  # Запуск основного цикла обработки событий
@@ -0,0 +1,255 @@
+import asyncio
+import os
+import signal
+import time
+
+from rstream import (
+    AMQPMessage,  # Импорт AMQP-сообщений для обработки входящих сообщений
+    Consumer,     # Импорт Consumer для потребления сообщений
+    MessageContext,  # Контекст сообщения для обработки
+    ConsumerOffsetSpecification,  # Спецификация смещения для потребителя
+    OffsetType,  # Типы смещений для потребителя
+    OffsetNotFound,  # Сохраненного смещения для подписчика нет
+)
+
+from aggregators import create_aggregators
+from checkpoint import load_snapshot, save_snapshot
+
+# Имя потока, с которым будем работать
+STREAM_NAME = "test_stream"
+
+# Статистики через запятую: все считаются по одной подписке и одному разбору сообщения
+AGGREGATORS = os.getenv("AGGREGATORS", "min_max,average,window_median,quantiles").split(",")
+
+# Имя подписчика: под ним брокер хранит смещение (server-side offset tracking)
+SUBSCRIBER_NAME = os.getenv("SUBSCRIBER_NAME", "client-stats")
+
+# Файл снимка состояния статистик (должен лежать на томе, чтобы пережить пересоздание контейнера)
+SNAPSHOT_PATH = os.getenv("SNAPSHOT_PATH", "client-stats.snapshot.json")
+
+# Интервал сохранения смещения и снимка (в секундах)
+CHECKPOINT_INTERVAL = float(os.getenv("CHECKPOINT_INTERVAL", "10"))
+
+# Размер пачки для векторной обработки (нужен numpy); 0 — обработка по одному сообщению
+BATCH_SIZE = int(os.getenv("BATCH_SIZE", "0"))
+
+# Неполная пачка обрабатывается не реже чем раз в BATCH_FLUSH_INTERVAL секунд
+BATCH_FLUSH_INTERVAL = float(os.getenv("BATCH_FLUSH_INTERVAL", "1"))
+
+# Интервал вывода результатов (в секундах); 0 — строка на каждое сообщение
+REPORT_INTERVAL = float(os.getenv("REPORT_INTERVAL", "0"))
+
+# Создаем статистики
+aggregators = create_aggregators(name.strip() for name in AGGREGATORS if name.strip())
+
+# Пачка значений для векторной обработки
+if BATCH_SIZE > 0:
+    from batching import Batch
+    batch = Batch(BATCH_SIZE)
+else:
+    batch = None
+
+# Смещение последнего учтенного сообщения и последнего сохраненного снимка
+last_offset = None
+checkpointed_offset = None
+
+# Число сообщений, учтенных статистиками
+processed = 0
+
+
+async def on_message(msg: AMQPMessage, message_context: MessageContext):
+    """
+    Обработчик сообщений, который:
+    - Преобразует сообщение в число (один раз для всех статистик).
+    - Передает число каждой статистике (или кладет в пачку в режиме BATCH_SIZE).
+    - Печатает полученное значение и текущие результаты всех статистик,
+      если не задан REPORT_INTERVAL.
+    """
+    global last_offset, processed
+
+    try:
+        # Преобразование тела сообщения в число
+        value = float(msg)
+    except ValueError:
+        # Если сообщение не удалось преобразовать в число, печатаем ошибку
+        print(f"Invalid value received: {msg}")
+        last_offset = message_context.offset
+        return
+
+    # Время сообщения нужно окнам по времени
+    timestamp = message_context.timestamp
+    last_offset = message_context.offset
+
+    # Режим пачек: статистики обновляются векторно по заполнении пачки
+    if batch is not None:
+        if batch.add(value, timestamp):
+            processed += batch.flush(aggregators)
+        return
+
+    # Обновление всех статистик
+    for aggregator in aggregators:
+        aggregator.update(value, timestamp)
+    processed += 1
+
+    # Печатаем полученное значение и результаты
+    if REPORT_INTERVAL <= 0:
+        print(f"Received value: {value} | " + " | ".join(aggregator.report() for aggregator in aggregators))
+
+
+def flush():
+    """
+    Передает статистикам неполную пачку (в режиме BATCH_SIZE).
+    """
+    global processed
+
+    if batch is not None:
+        processed += batch.flush(aggregators)
+
+
+async def flush_periodically():
+    """
+    Раз в BATCH_FLUSH_INTERVAL секунд обрабатывает неполную пачку,
+    чтобы при малом потоке результаты не отставали.
+    """
+    while True:
+        await asyncio.sleep(BATCH_FLUSH_INTERVAL)
+        flush()
+
+
+async def report_periodically():
+    """
+    Раз в REPORT_INTERVAL секунд печатает результаты всех статистик
+    и скорость обработки.
+    """
+    reported = processed
+    reported_at = time.monotonic()
+    while True:
+        await asyncio.sleep(REPORT_INTERVAL)
+        flush()
+
+        now = time.monotonic()
+        rate = (processed - reported) / (now - reported_at)
+        reported, reported_at = processed, now
+        print(f"Processed: {processed} ({rate:,.0f} msg/s) | " + " | ".join(a.report() for a in aggregators))
+
+
+async def checkpoint(consumer: Consumer):
+    """
+    Сохраняет снимок статистик вместе со смещением последнего учтенного сообщения,
+    затем сохраняет это смещение на брокере.
+    Снимок пишется первым: смещение на брокере никогда не опережает снимок.
+    """
+    global checkpointed_offset
+
+    # Снимок должен включать все сообщения до last_offset
+    flush()
+
+    offset = last_offset
+    if offset is None or offset == checkpointed_offset:
+        return
+
+    save_snapshot(SNAPSHOT_PATH, STREAM_NAME, offset, aggregators)
+    await consumer.store_offset(STREAM_NAME, SUBSCRIBER_NAME, offset)
+    checkpointed_offset = offset
+
+
+async def checkpoint_periodically(consumer: Consumer):
+    """
+    Раз в CHECKPOINT_INTERVAL секунд сохраняет снимок и смещение.
+    """
+    while True:
+        await asyncio.sleep(CHECKPOINT_INTERVAL)
+        try:
+            await checkpoint(consumer)
+        except Exception as e:
+            print(f"Checkpoint failed: {e}")
+
+
+async def resume_offset(consumer: Consumer) -> ConsumerOffsetSpecification:
+    """
+    Восстанавливает статистики из снимка и возвращает смещение, с которого читать поток:
+    - есть снимок — со следующего после сохраненного сообщения (без повторного чтения истории);
+    - снимка нет — с начала потока (состояние статистик нельзя восстановить по одному смещению).
+    """
+    global last_offset, checkpointed_offset
+
+    snapshot_offset = load_snapshot(SNAPSHOT_PATH, STREAM_NAME, aggregators)
+
+    try:
+        stored_offset = await consumer.query_offset(STREAM_NAME, SUBSCRIBER_NAME)
+    except OffsetNotFound:
+        stored_offset = None
+
+    if snapshot_offset is not None:
+        if stored_offset is not None and stored_offset != snapshot_offset:
+            print(f"Stored offset {stored_offset} differs from snapshot offset {snapshot_offset}, using snapshot")
+        print(f"Restored statistics from {SNAPSHOT_PATH}, resuming after offset {snapshot_offset}")
+        last_offset = checkpointed_offset = snapshot_offset
+        return ConsumerOffsetSpecification(OffsetType.OFFSET, snapshot_offset + 1)
+
+    if stored_offset is not None:
+        print(f"Stored offset {stored_offset} found but no snapshot, replaying stream from the beginning")
+    return ConsumerOffsetSpecification(OffsetType.FIRST, None)
+
+
+async def main():
+    """
+    Основная асинхронная функция, которая:
+    - Создает одного потребителя для потока.
+    - Восстанавливает статистики из снимка и продолжает чтение с сохраненного смещения.
+    - Подписывается на поток один раз для всех статистик.
+    - Обрабатывает сообщения, обновляя все статистики и периодически сохраняя снимок.
+    """
+
+    # Создание потребителя для подключения к RabbitMQ
+    consumer = Consumer(
+        host="rabbitmq",  # Адрес хоста RabbitMQ
+        port=5552,        # Порт для подключения
+        username="guest", # Имя пользователя для авторизации
+        password="guest", # Пароль для авторизации
+    )
+
+    # Создание потока, если он еще не существует
+    await consumer.create_stream(STREAM_NAME, exists_ok=True)
+
+    # Запуск потребителя для начала получения сообщений
+    await consumer.start()
+
+    # Смещение, с которого продолжаем чтение
+    offset_specification = await resume_offset(consumer)
+
+    # Подписка на поток с указанием обработчика сообщений и спецификации смещения
+    await consumer.subscribe(
+        stream=STREAM_NAME,  # Имя потока
+        callback=on_message,  # Функция-обработчик сообщений
+        offset_specification=offset_specification,  # Настройка смещения для начала получения сообщений
+        subscriber_name=SUBSCRIBER_NAME,  # Имя для хранения смещения на брокере
+    )
+
+    # Выводим сообщение о начале работы потребителя
+    print(f"Consumer started with aggregators: {', '.join(a.name for a in aggregators)}. Waiting for messages...")
+
+    # Периодическое сохранение снимка; при остановке контейнера — сохранение перед выходом
+    tasks = [asyncio.create_task(checkpoint_periodically(consumer))]
+    if batch is not None:
+        tasks.append(asyncio.create_task(flush_periodically()))
+    if REPORT_INTERVAL > 0:
+        tasks.append(asyncio.create_task(report_periodically()))
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, consumer.stop)
+
+    # Запуск потребителя для обработки сообщений
+    await consumer.run()
+
+    for task in tasks:
+        task.cancel()
+    await checkpoint(consumer)
+    await consumer.close()
+
+
+if __name__ == "__main__":
+    """
+    Точка входа в программу.
+    Использует asyncio для запуска основной асинхронной функции.
+    """
+    with asyncio.Runner() as runner:
+        runner.run(main())  # Запуск основного цикла обработки событий
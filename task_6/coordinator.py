@@ -0,0 +1,124 @@
+import asyncio
+import json
+import os
+import time
+
+from rstream import (
+    Consumer,     # Импорт Consumer для потребления сообщений
+    MessageContext,  # Контекст сообщения для обработки
+    ConsumerOffsetSpecification,  # Спецификация смещения для потребителя
+    OffsetType,  # Типы смещений для потребителя
+)
+
+from aggregators import create_aggregators
+from checkpoint import restore_state
+
+# Поток частичных результатов разделов (публикует client_partition.py)
+PARTIALS_STREAM = os.getenv("PARTIALS_STREAM", "test_super_stream-partials")
+
+# Статистики через запятую (те же, что у потребителей разделов)
+AGGREGATORS = os.getenv("AGGREGATORS", "min_max,average,quantiles").split(",")
+
+# Интервал вывода объединенных результатов (в секундах)
+REPORT_INTERVAL = float(os.getenv("REPORT_INTERVAL", "5"))
+
+# При запуске читаются частичные результаты за последние PARTIALS_LOOKBACK секунд:
+# этого достаточно, чтобы получить последнее состояние каждого раздела
+PARTIALS_LOOKBACK = float(os.getenv("PARTIALS_LOOKBACK", "60"))
+
+# Последний частичный результат по каждому разделу
+latest: dict[str, dict] = {}
+
+
+async def on_message(msg: bytes, message_context: MessageContext):
+    """
+    Обработчик частичных результатов: запоминает самое свежее состояние раздела.
+    Сравнение по смещению раздела отбрасывает устаревшие результаты
+    (например, от потребителя, который уже передал раздел другому).
+    """
+    try:
+        partial = json.loads(msg)
+        partition = partial["stream"]
+        offset = partial["offset"]
+    except (ValueError, KeyError, TypeError):
+        print(f"Invalid partial result received: {msg[:100]}")
+        return
+
+    current = latest.get(partition)
+    if current is None or offset >= current["offset"]:
+        latest[partition] = partial
+
+
+def merge_partials():
+    """
+    Объединяет последние частичные результаты всех разделов в общие статистики.
+    """
+    total = create_aggregators(name.strip() for name in AGGREGATORS if name.strip())
+    for partial in latest.values():
+        part = create_aggregators(aggregator.name for aggregator in total)
+        restore_state(partial, part)
+        for aggregator, other in zip(total, part):
+            aggregator.merge(other)
+    return total
+
+
+async def report_periodically():
+    """
+    Раз в REPORT_INTERVAL секунд печатает объединенные результаты по всем разделам.
+    """
+    while True:
+        await asyncio.sleep(REPORT_INTERVAL)
+        if not latest:
+            print("No partial results yet")
+            continue
+
+        try:
+            total = merge_partials()
+        except (ValueError, KeyError) as e:
+            print(f"Merging partial results failed: {e}")
+            continue
+
+        offsets = ", ".join(f"{partition}@{latest[partition]['offset']}" for partition in sorted(latest))
+        print(f"Partitions: {offsets} | " + " | ".join(aggregator.report() for aggregator in total))
+
+
+async def main():
+    """
+    Основная асинхронная функция, которая:
+    - Читает поток частичных результатов разделов.
+    - Хранит последнее состояние каждого раздела.
+    - Периодически объединяет состояния (merge()) и печатает общие результаты.
+    """
+
+    consumer = Consumer(
+        host="rabbitmq",  # Адрес хоста RabbitMQ
+        port=5552,        # Порт для подключения
+        username="guest", # Имя пользователя для авторизации
+        password="guest", # Пароль для авторизации
+    )
+
+    await consumer.create_stream(PARTIALS_STREAM, exists_ok=True)
+    await consumer.start()
+
+    # Состояния накопленные, поэтому историю потока целиком читать не нужно
+    since = int((time.time() - PARTIALS_LOOKBACK) * 1000)
+    await consumer.subscribe(
+        stream=PARTIALS_STREAM,
+        callback=on_message,
+        offset_specification=ConsumerOffsetSpecification(OffsetType.TIMESTAMP, since),
+    )
+
+    print(f"Coordinator started on '{PARTIALS_STREAM}' with aggregators: {', '.join(AGGREGATORS)}")
+
+    task = asyncio.create_task(report_periodically())
+    await consumer.run()
+    task.cancel()
+
+
+if __name__ == "__main__":
+    """
+    Точка входа в программу.
+    Использует asyncio для запуска основной асинхронной функции.
+    """
+    with asyncio.Runner() as runner:
+        runner.run(main())  # Запуск основного цикла обработки событий
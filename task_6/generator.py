@@ -1,18 +1,78 @@
 import asyncio
+import os
 import random
-from rstream import Producer
+import time
+from rstream import (
+    AMQPMessage,  # AMQP-сообщение с ключом маршрутизации в application_properties
+    CompressionType,  # Сжатие сообщений внутри sub-entry
+    ConfirmationStatus,  # Подтверждение публикации от брокера
+    Producer,
+    RouteType,  # Способ выбора раздела по ключу
+    SuperStreamCreationOption,  # Число разделов при создании суперпотока
+    SuperStreamProducer,  # Публикация в разделенный поток (super stream)
+)
+
+from aggregators import QuantileSketch
 
 # Имя потока, с которым будем работать
 STREAM_NAME = "test_stream"
 
-async def main():
+# Имя суперпотока; если задано, сообщения публикуются в его разделы вместо STREAM_NAME
+SUPER_STREAM = os.getenv("SUPER_STREAM", "")
+
+# Число разделов суперпотока (используется при его создании)
+SUPER_STREAM_PARTITIONS = int(os.getenv("SUPER_STREAM_PARTITIONS", "3"))
+
+# Число ключей маршрутизации (источников): сообщения одного ключа всегда попадают в один раздел
+ROUTING_KEYS = int(os.getenv("ROUTING_KEYS", "12"))
+
+# Интервал между сообщениями (в секундах)
+SEND_INTERVAL = float(os.getenv("SEND_INTERVAL", "60"))
+
+# Режим генератора: interval — по одному сообщению раз в SEND_INTERVAL секунд,
+# load — нагрузка с заданной скоростью и учетом подтверждений брокера
+GENERATOR_MODE = os.getenv("GENERATOR_MODE", "interval")
+
+# Целевая скорость в режиме load (сообщений в секунду); 0 — без ограничения
+LOAD_RATE = float(os.getenv("LOAD_RATE", "10000"))
+
+# Длительность нагрузки (в секундах)
+LOAD_DURATION = float(os.getenv("LOAD_DURATION", "60"))
+
+# Число сообщений в одной отправке (send_batch — один кадр публикации)
+LOAD_BATCH_SIZE = int(os.getenv("LOAD_BATCH_SIZE", "100"))
+
+# Число сообщений в одном sub-entry (одна запись потока из нескольких сообщений); 0 — без sub-entry
+LOAD_SUB_ENTRY_SIZE = int(os.getenv("LOAD_SUB_ENTRY_SIZE", "0"))
+
+# Сжатие sub-entry: none или gzip
+LOAD_COMPRESSION = os.getenv("LOAD_COMPRESSION", "none")
+
+# Наибольшее число отправленных, но еще не подтвержденных сообщений
+LOAD_MAX_OUTSTANDING = int(os.getenv("LOAD_MAX_OUTSTANDING", "10000"))
+
+# Сколько ждать оставшиеся подтверждения после окончания нагрузки (в секундах)
+LOAD_CONFIRM_TIMEOUT = float(os.getenv("LOAD_CONFIRM_TIMEOUT", "30"))
+
+# Интервал вывода промежуточной статистики нагрузки (в секундах)
+LOAD_REPORT_INTERVAL = float(os.getenv("LOAD_REPORT_INTERVAL", "5"))
+
+# Поддерживаемые виды сжатия sub-entry
+COMPRESSION = {"none": CompressionType.No, "gzip": CompressionType.Gzip}
+
+
+async def routing_key(message: AMQPMessage) -> str:
     """
-    Основная асинхронная функция, которая:
-    - Подключается к RabbitMQ с использованием rstream Producer.
-    - Создает или подключается к потоку STREAM_NAME.
-    - Отправляет случайные числа в поток каждую минуту.
+    Возвращает ключ, по хешу которого выбирается раздел суперпотока.
     """
-    
+    return message.application_properties["key"]
+
+
+async def publish_to_stream():
+    """
+    Отправляет случайные числа в поток STREAM_NAME.
+    """
+
     # Создание асинхронного контекстного менеджера для подключения к RabbitMQ
     async with Producer(
         host="rabbitmq",  # Адрес хоста RabbitMQ
@@ -25,7 +85,7 @@ async def main():
         await producer.create_stream(STREAM_NAME, exists_ok=True)
         print(f"Stream '{STREAM_NAME}' created or already exists")
         
-        # Вечный цикл, отправляющий случайные числа в поток каждую минуту
+        # Вечный цикл, отправляющий случайные числа в поток раз в SEND_INTERVAL секунд
         while True:
             # Генерация случайного числа от 0 до 100
             number = random.randint(0, 100)
@@ -34,8 +94,216 @@ async def main():
             await producer.send(STREAM_NAME, str(number).encode())
             print(f"Sent: {number}")
             
-            # Ожидание 60 секунд перед отправкой следующего числа
-            await asyncio.sleep(60)
+            # Ожидание перед отправкой следующего числа
+            await asyncio.sleep(SEND_INTERVAL)
+
+
+async def publish_to_super_stream():
+    """
+    Отправляет случайные числа в суперпоток SUPER_STREAM.
+    Каждое сообщение получает ключ источника; раздел выбирается по хешу ключа,
+    поэтому порядок сообщений одного источника сохраняется внутри раздела.
+    """
+
+    async with SuperStreamProducer(
+        host="rabbitmq",
+        port=5552,
+        username="guest",
+        password="guest",
+        super_stream=SUPER_STREAM,
+        # Суперпоток (exchange и потоки-разделы) создается, если его еще нет
+        super_stream_creation_option=SuperStreamCreationOption(n_partitions=SUPER_STREAM_PARTITIONS),
+        routing_extractor=routing_key,
+        routing=RouteType.Hash,
+    ) as producer:
+        print(f"Super stream '{SUPER_STREAM}' created or already exists")
+
+        while True:
+            key = f"source-{random.randrange(ROUTING_KEYS)}"
+            number = random.randint(0, 100)
+
+            # Тело сообщения — то же число, что и в обычном потоке
+            message = AMQPMessage(body=str(number).encode(), application_properties={"key": key})
+            await producer.send(message)
+            print(f"Sent: {number} (key {key})")
+
+            await asyncio.sleep(SEND_INTERVAL)
+
+
+class LoadStats:
+    """
+    Счетчики нагрузки, окно неподтвержденных сообщений и задержки подтверждений.
+    Задержка — время от отправки до подтверждения записи (сообщения или sub-entry), в миллисекундах;
+    квантили считаются скетчем за постоянную память.
+    """
+
+    def __init__(self, max_outstanding):
+        self.max_outstanding = max_outstanding
+        self.sent = 0
+        self.confirmed = 0
+        self.failed = 0
+        self.outstanding = 0
+        self.last_confirm_at = None
+        self.latency = QuantileSketch()
+        self.max_latency = 0.0
+        # Установлено, пока в окне есть место
+        self.window = asyncio.Event()
+        self.window.set()
+
+    async def reserve(self, count):
+        """
+        Ждет, пока в окне освободится место для count сообщений, и занимает его.
+        """
+        while self.outstanding + count > self.max_outstanding:
+            self.window.clear()
+            await self.window.wait()
+        self.outstanding += count
+
+    def confirm_callback(self, count, sent_at):
+        """
+        Обработчик подтверждения записи из count сообщений, отправленной в момент sent_at.
+        """
+        def on_publish_confirm(status: ConfirmationStatus):
+            now = time.perf_counter()
+            if status.is_confirmed:
+                latency = (now - sent_at) * 1000
+                self.confirmed += count
+                self.latency.update(latency)
+                self.max_latency = max(self.max_latency, latency)
+                self.last_confirm_at = now
+            else:
+                self.failed += count
+            self.outstanding -= count
+            self.window.set()
+
+        return on_publish_confirm
+
+    def latency_report(self):
+        return (" | ".join(f"{key}: {value:.2f} ms" for key, value in self.latency.result().items() if value is not None)
+                + f" | max: {self.max_latency:.2f} ms")
+
+
+async def report_load_periodically(stats: LoadStats):
+    """
+    Раз в LOAD_REPORT_INTERVAL секунд печатает скорость отправки и подтверждений.
+    """
+    sent, confirmed = stats.sent, stats.confirmed
+    reported_at = time.perf_counter()
+    while True:
+        await asyncio.sleep(LOAD_REPORT_INTERVAL)
+        now = time.perf_counter()
+        elapsed = now - reported_at
+        print(f"Sent: {stats.sent} ({(stats.sent - sent) / elapsed:,.0f} msg/s) | "
+              f"Confirmed: {stats.confirmed} ({(stats.confirmed - confirmed) / elapsed:,.0f} msg/s) | "
+              f"Outstanding: {stats.outstanding} | Failed: {stats.failed}")
+        sent, confirmed, reported_at = stats.sent, stats.confirmed, now
+
+
+async def publish_load():
+    """
+    Отправляет случайные числа в поток STREAM_NAME с целевой скоростью LOAD_RATE в течение LOAD_DURATION секунд:
+    - сообщения отправляются пачками по LOAD_BATCH_SIZE (send_batch) или, при LOAD_SUB_ENTRY_SIZE > 0,
+      записями sub-entry с необязательным сжатием (send_sub_entry);
+    - неподтвержденных сообщений не больше LOAD_MAX_OUTSTANDING: при заполненном окне отправка ждет подтверждений;
+    - в конце печатается достигнутая скорость и квантили задержки подтверждений.
+    """
+    if LOAD_COMPRESSION not in COMPRESSION:
+        raise ValueError(f"Unknown compression '{LOAD_COMPRESSION}', expected one of {', '.join(COMPRESSION)}")
+    if LOAD_COMPRESSION != "none" and LOAD_SUB_ENTRY_SIZE <= 0:
+        raise ValueError("Compression is applied to sub-entries, set LOAD_SUB_ENTRY_SIZE")
+    if LOAD_MAX_OUTSTANDING < LOAD_BATCH_SIZE:
+        raise ValueError("LOAD_MAX_OUTSTANDING must be at least LOAD_BATCH_SIZE")
+    compression = COMPRESSION[LOAD_COMPRESSION]
+
+    async with Producer(
+        host="rabbitmq",
+        port=5552,
+        username="guest",
+        password="guest",
+    ) as producer:
+        await producer.create_stream(STREAM_NAME, exists_ok=True)
+
+        # Тела сообщений заранее: генерация строк не должна ограничивать скорость отправки
+        values = [str(number).encode() for number in range(101)]
+        stats = LoadStats(LOAD_MAX_OUTSTANDING)
+        interval = LOAD_BATCH_SIZE / LOAD_RATE if LOAD_RATE > 0 else 0.0
+        target = f"{LOAD_RATE:,.0f} msg/s" if LOAD_RATE > 0 else "unlimited"
+
+        print(f"Load: {target} for {LOAD_DURATION:.0f} s to '{STREAM_NAME}', batch {LOAD_BATCH_SIZE}, "
+              f"sub-entry {LOAD_SUB_ENTRY_SIZE or 'off'}, compression {LOAD_COMPRESSION}, "
+              f"max outstanding {LOAD_MAX_OUTSTANDING}")
+
+        reporter = asyncio.create_task(report_load_periodically(stats))
+        started = time.perf_counter()
+        deadline = started + LOAD_DURATION
+        next_send = started
+
+        while True:
+            now = time.perf_counter()
+            if now >= deadline:
+                break
+            # Расписание по абсолютному времени: паузы не накапливают ошибку,
+            # а отставание больше секунды (например, при заполненном окне) не догоняется всплеском
+            if next_send > now:
+                await asyncio.sleep(next_send - now)
+            elif now - next_send > 1.0:
+                next_send = now
+
+            batch = random.choices(values, k=LOAD_BATCH_SIZE)
+            await stats.reserve(len(batch))
+            sent_at = time.perf_counter()
+
+            if LOAD_SUB_ENTRY_SIZE > 0:
+                for start in range(0, len(batch), LOAD_SUB_ENTRY_SIZE):
+                    entry = batch[start:start + LOAD_SUB_ENTRY_SIZE]
+                    await producer.send_sub_entry(
+                        STREAM_NAME,
+                        entry,
+                        compression_type=compression,
+                        on_publish_confirm=stats.confirm_callback(len(entry), sent_at),
+                    )
+            else:
+                await producer.send_batch(
+                    STREAM_NAME,
+                    batch,
+                    on_publish_confirm=stats.confirm_callback(1, sent_at),
+                )
+
+            stats.sent += len(batch)
+            next_send += interval
+
+        sending_time = time.perf_counter() - started
+
+        # Ожидание оставшихся подтверждений
+        wait_until = time.perf_counter() + LOAD_CONFIRM_TIMEOUT
+        while stats.outstanding > 0 and time.perf_counter() < wait_until:
+            await asyncio.sleep(0.05)
+        reporter.cancel()
+
+        confirm_time = (stats.last_confirm_at or started) - started
+        print(f"Load finished: sent {stats.sent} in {sending_time:.1f} s ({stats.sent / sending_time:,.0f} msg/s, "
+              f"target {target}) | confirmed {stats.confirmed} "
+              f"({stats.confirmed / confirm_time if confirm_time > 0 else 0:,.0f} msg/s) | "
+              f"failed {stats.failed} | unconfirmed {stats.outstanding}")
+        print(f"Confirm latency: {stats.latency_report()}")
+
+
+async def main():
+    """
+    Основная асинхронная функция, которая:
+    - Подключается к RabbitMQ с использованием rstream Producer (или SuperStreamProducer).
+    - Создает или подключается к потоку STREAM_NAME (суперпотоку SUPER_STREAM).
+    - Отправляет случайные числа в поток раз в SEND_INTERVAL секунд (по умолчанию каждую минуту)
+      или, в режиме GENERATOR_MODE=load, с заданной скоростью и отчетом о подтверждениях.
+    """
+    if GENERATOR_MODE == "load":
+        await publish_load()
+    elif GENERATOR_MODE != "interval":
+        raise ValueError(f"Unknown generator mode '{GENERATOR_MODE}', expected interval or load")
+    elif SUPER_STREAM:
+        await publish_to_super_stream()
+    else:
+        await publish_to_stream()
 
 
 if __name__ == "__main__":